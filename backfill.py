@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# backfill.py
+"""
+Seeds the quote database from channel history.
+
+Streams a channel's history oldest-first, picks out messages that already carry the configured
+REACTION_EMOJI, and inserts them in large batches. Progress is checkpointed per channel, so an
+interrupted backfill resumes where it stopped.
+
+Used by the /backfill command in bot.py, or offline while the bot is stopped:
+
+    python backfill.py CHANNEL_ID [CHANNEL_ID ...]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+import discord
+
+from config import BACKFILL_PAGE_DELAY, BOT_TOKEN, LOG_LEVEL
+import database
+import utils
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 500  # Quotes per insert transaction.
+CHECKPOINT_EVERY = 1000  # Save progress at least this often (in scanned messages), even if nothing matched.
+
+def quote_row(message, adder_user_id):
+    """Builds an add_quotes_bulk row for a message."""
+    return (message.id, message.guild.id, message.channel.id, message.author.id, message.author.name,
+            message.content, message.jump_url, adder_user_id, *utils.first_image_attachment(message))
+
+async def backfill_channel(channel, adder_user_id, batch_size=BATCH_SIZE):
+    """
+    Imports every reaction-quoted message in the channel that is newer than its checkpoint.
+
+    Args:
+        channel: A discord.TextChannel (or thread) the bot can read history in.
+        adder_user_id: Recorded as the adder of every imported quote.
+        batch_size: The number of quotes inserted per transaction.
+
+    Returns:
+        A tuple of (messages scanned, quotes added).
+    """
+    checkpoint = await database.get_backfill_checkpoint(channel.id)
+    after = discord.Object(id=checkpoint) if checkpoint else None
+
+    batch = []
+    scanned = added = 0
+    last_message_id = checkpoint
+    async for message in channel.history(limit=None, after=after, oldest_first=True):
+        scanned += 1
+        last_message_id = message.id
+        if not message.author.bot and any(utils.is_quote_emoji(reaction.emoji) for reaction in message.reactions):
+            batch.append(quote_row(message, adder_user_id))
+
+        if len(batch) >= batch_size or scanned % CHECKPOINT_EVERY == 0:
+            added += await database.add_quotes_bulk(batch, checkpoint=(channel.id, last_message_id))
+            batch = []
+        if BACKFILL_PAGE_DELAY and scanned % 100 == 0:
+            # history() fetches 100 messages per request. discord.py already waits out rate limits;
+            # this only leaves extra room for other work on a shared token.
+            await asyncio.sleep(BACKFILL_PAGE_DELAY)
+
+    if last_message_id is not None and last_message_id != checkpoint:
+        added += await database.add_quotes_bulk(batch, checkpoint=(channel.id, last_message_id))
+    log.info("Backfilled #%s: scanned %d message(s), added %d quote(s)", channel, scanned, added)
+    return scanned, added
+
+async def backfill_channels(client, channel_ids):
+    await database.connect()
+    await database.migrate()
+    for channel_id in channel_ids:
+        channel = client.get_channel(channel_id)
+        if channel is None:
+            log.warning("Channel not found: %s", channel_id)
+            continue
+        try:
+            await backfill_channel(channel, client.user.id)
+        except discord.Forbidden:
+            log.warning("Bot lacks permission to read history in channel: %s", channel_id)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("channel_ids", nargs="+", type=int, metavar="CHANNEL_ID", help="A channel to backfill.")
+    channel_ids = parser.parse_args(argv).channel_ids
+
+    intents = discord.Intents.default()
+    intents.message_content = True
+    client = discord.Client(intents=intents)
+
+    @client.event
+    async def on_ready():
+        try:
+            await backfill_channels(client, channel_ids)
+        finally:
+            await database.close()
+            await client.close()
+
+    client.run(BOT_TOKEN, log_level=logging.getLevelName(LOG_LEVEL), root_logger=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
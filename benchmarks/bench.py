@@ -0,0 +1,216 @@
+# benchmarks/bench.py
+"""
+Offline benchmarks for database.py, utils.fuzzy_search and the command handlers in bot.py.
+
+Builds synthetic quote databases of the requested sizes, drives the handlers through the fakes in
+benchmarks/fakes.py, and prints throughput and p50/p99 latency per operation. No network access or
+bot token is needed.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench --sizes 10000 100000 1000000 --iterations 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import discord
+
+import bot as quote_bot
+import database
+import utils
+from benchmarks.fakes import FakeGuild, FakeInteraction, FakeMessage, reaction_payload
+from config import REACTION_EMOJI
+
+GUILD_COUNT = 4
+CHANNELS_PER_GUILD = 5
+BOT_USER_ID = 1
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "zu", "pe", "do", "ha", "ji", "qu", "ri", "an", "el", "or"]
+
+def make_words(rng, count):
+    return ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(count)]
+
+def typo(rng, text):
+    """Swaps two adjacent characters, the kind of mistake fuzzy search should forgive."""
+    if len(text) < 3:
+        return text
+    i = rng.randrange(len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+class Corpus:
+    """A synthetic quotes database plus the fake guilds, channels and vocabulary it was built from."""
+
+    def __init__(self, path, size, seed=0):
+        self.path = path
+        self.size = size
+        rng = random.Random(seed)
+        self.words = make_words(rng, 2000)
+        self.author_names = sorted({w.capitalize() for w in make_words(rng, max(20, size // 200))})
+        self.guilds = {}
+        for g in range(GUILD_COUNT):
+            guild = FakeGuild(1000 + g, shard_id=g % 2)
+            for c in range(CHANNELS_PER_GUILD):
+                guild.add_channel(guild.id * 100 + c)
+            self.guilds[guild.id] = guild
+        self.next_message_id = None
+
+    def rows(self, rng):
+        guilds = list(self.guilds.values())
+        for i in range(self.size):
+            guild = rng.choice(guilds)
+            channel_id = rng.choice(list(guild.channels))
+            author_index = min(int(rng.paretovariate(1.2)) - 1, len(self.author_names) - 1)
+            content = " ".join(rng.choice(self.words) for _ in range(rng.randint(4, 30)))
+            message_id = 10 ** 11 + i
+            yield (message_id, guild.id, channel_id, 5000 + author_index, self.author_names[author_index], content,
+                   f"https://discord.com/channels/{guild.id}/{channel_id}/{message_id}", 2, None, "")
+
+    async def build(self, seed=0):
+        if os.path.exists(self.path):
+            return False
+        # Let database.py create the real schema (indexes, FTS triggers), then bulk load with plain sqlite3.
+        await database.connect(self.path)
+        await database.migrate()
+        await database.close()
+        db = sqlite3.connect(self.path)
+        with db:
+            db.executemany("""
+                INSERT INTO quotes (message_id, guild_id, channel_id, author_id, author_name, content, jump_url,
+                                    adder_user_id, attachment_url, attachment_content_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, self.rows(random.Random(seed)))
+        db.close()
+        return True
+
+    def reset_message_ids(self):
+        """Starts new-message IDs above anything a previous run added to a reused database."""
+        db = sqlite3.connect(self.path)
+        (max_message_id,) = db.execute("SELECT MAX(message_id) FROM quotes").fetchone()
+        db.close()
+        self.next_message_id = max(10 ** 12, max_message_id or 0)
+
+    def new_message(self, rng):
+        guild = rng.choice(list(self.guilds.values()))
+        channel = rng.choice(list(guild.channels.values()))
+        self.next_message_id += 1
+        message = FakeMessage(self.next_message_id, channel, 9000, "Reactor",
+                              " ".join(rng.choice(self.words) for _ in range(10)))
+        channel.messages[message.id] = message
+        return message
+
+    def interaction(self, rng):
+        guild = rng.choice(list(self.guilds.values()))
+        channel = rng.choice(list(guild.channels.values()))
+        return FakeInteraction(guild, channel, user_id=rng.randint(2, 500))
+
+    def api_calls(self):
+        return sum(channel.fetches for guild in self.guilds.values() for channel in guild.channels.values())
+
+def quote_emoji():
+    if isinstance(REACTION_EMOJI, int):
+        return discord.PartialEmoji(name="quote", id=REACTION_EMOJI)
+    return discord.PartialEmoji(name=REACTION_EMOJI)
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def measure(name, iterations, make_call):
+    """Runs make_call() `iterations` times sequentially and returns a result row."""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call = make_call()
+        t0 = time.perf_counter()
+        await call
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (name, iterations, iterations / elapsed, percentile(latencies, 0.50), percentile(latencies, 0.99))
+
+async def run_size(corpus, iterations, seed=0):
+    rng = random.Random(seed + 1)
+    quote_bot.bot.get_guild = corpus.guilds.get
+    quote_bot.bot._connection.user = discord.Object(id=BOT_USER_ID)
+
+    corpus.reset_message_ids()
+    await database.connect(corpus.path)
+    results = []
+    try:
+        await database.migrate()
+        results.append(await measure("index load (sampler)", 1, lambda: database.get_random_quote()))
+        results.append(await measure("index load (fuzzy words, background)", 1, lambda: database.load_indexes()))
+        api_calls_before = corpus.api_calls()
+
+        results.append(await measure("db.get_random_quote", iterations,
+                                     lambda: database.get_random_quote(rng.choice(list(corpus.guilds)))))
+        results.append(await measure("db.get_quotes_by_search_term", iterations,
+                                     lambda: database.get_quotes_by_search_term(rng.choice(corpus.words),
+                                                                                rng.choice(list(corpus.guilds)))))
+        results.append(await measure("db.get_quote_by_message_id", iterations,
+                                     lambda: database.get_quote_by_message_id(10 ** 11 + rng.randrange(corpus.size))))
+
+        async def run_fuzzy_search():
+            utils.fuzzy_search(typo(rng, rng.choice(corpus.author_names)), corpus.author_names)
+        results.append(await measure(f"utils.fuzzy_search ({len(corpus.author_names)} names)", iterations,
+                                     run_fuzzy_search))
+
+        results.append(await measure("/randomquote", iterations,
+                                     lambda: quote_bot.randomquote.callback(corpus.interaction(rng))))
+        results.append(await measure("/search", iterations,
+                                     lambda: quote_bot.search.callback(corpus.interaction(rng), rng.choice(corpus.words))))
+        results.append(await measure("/search (typo)", iterations,
+                                     lambda: quote_bot.search.callback(corpus.interaction(rng),
+                                                                       typo(rng, rng.choice(corpus.words)))))
+        results.append(await measure("/search_author (list)", iterations,
+                                     lambda: quote_bot.search_author.callback(corpus.interaction(rng), None)))
+        results.append(await measure("/search_author (name)", iterations,
+                                     lambda: quote_bot.search_author.callback(
+                                         corpus.interaction(rng), typo(rng, rng.choice(corpus.author_names)))))
+        results.append(await measure("/search_author autocomplete", iterations,
+                                     lambda: quote_bot.search_author_autocomplete(
+                                         corpus.interaction(rng), rng.choice(corpus.author_names)[:rng.randint(1, 4)])))
+
+        ignored = discord.PartialEmoji(name="\N{DUCK}")
+        results.append(await measure("on_raw_reaction_add (other emoji)", iterations,
+                                     lambda: quote_bot.on_raw_reaction_add(
+                                         reaction_payload(corpus.new_message(rng), 2, ignored))))
+        results.append(await measure("on_raw_reaction_add (new quote)", iterations,
+                                     lambda: quote_bot.on_raw_reaction_add(
+                                         reaction_payload(corpus.new_message(rng), 2, quote_emoji()))))
+        api_calls = corpus.api_calls() - api_calls_before
+    finally:
+        await database.close()
+    return results, api_calls
+
+def print_report(size, results, api_calls):
+    print(f"\n=== {size:,} quotes ===")
+    print(f"{'operation':<40} {'n':>6} {'ops/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, n, throughput, p50, p99 in results:
+        print(f"{name:<40} {n:>6} {throughput:>10.1f} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+    print(f"fetch_message calls during the run: {api_calls}")
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--data-dir", help="Keep generated databases here and reuse them across runs.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        for size in args.sizes:
+            corpus = Corpus(os.path.join(data_dir, f"quotes_{size}.db"), size, args.seed)
+            t0 = time.perf_counter()
+            if await corpus.build(args.seed):
+                print(f"Built {size:,}-quote corpus in {time.perf_counter() - t0:.1f}s")
+            results, api_calls = await run_size(corpus, args.iterations, args.seed)
+            print_report(size, results, api_calls)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+# benchmarks/fakes.py
+"""
+Local stand-ins for the Discord objects the handlers in bot.py touch.
+
+Only the attributes and coroutines the handlers actually use are implemented. Nothing here talks
+to the network: sends and responses are recorded in memory, and fetch_message serves messages
+from a dict.
+"""
+from types import SimpleNamespace
+
+import discord
+
+class FakeResponse:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+
+    async def edit_message(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+
+    async def defer(self, **kwargs):
+        pass
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+
+class FakeChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.messages = {}
+        self.sent = []
+        self.fetches = 0
+        self.mention = f"<#{channel_id}>"
+
+    def __str__(self):
+        return f"channel-{self.id}"
+
+    async def fetch_message(self, message_id):
+        self.fetches += 1
+        try:
+            return self.messages[message_id]
+        except KeyError:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message") from None
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+
+class FakeGuild:
+    def __init__(self, guild_id, shard_id=0):
+        self.id = guild_id
+        self.shard_id = shard_id
+        self.channels = {}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def add_channel(self, channel_id):
+        channel = FakeChannel(channel_id, self)
+        self.channels[channel_id] = channel
+        return channel
+
+class FakeMessage:
+    def __init__(self, message_id, channel, author_id, author_name, content, attachments=(), bot=False):
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = SimpleNamespace(id=author_id, name=author_name, bot=bot)
+        self.content = content
+        self.attachments = list(attachments)
+        self.reactions = []
+        self.jump_url = f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{message_id}"
+
+class FakeInteraction:
+    """Enough of discord.Interaction for the slash command callbacks."""
+
+    def __init__(self, guild, channel, user_id=1, roles=()):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.user = SimpleNamespace(id=user_id, roles=[SimpleNamespace(name=name) for name in roles])
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+def reaction_payload(message, user_id, emoji):
+    """Builds the raw gateway payload on_raw_reaction_add receives."""
+    return SimpleNamespace(
+        message_id=message.id,
+        channel_id=message.channel.id,
+        guild_id=message.guild.id,
+        user_id=user_id,
+        emoji=emoji,
+        member=None,
+    )
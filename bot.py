@@ -1,246 +1,525 @@
 #!/usr/bin/env python3
 # v1.2
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import defaultdict
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
-from datetime import datetime, time, timezone
+from datetime import datetime, timezone
 
-from config import BOT_TOKEN, REACTION_EMOJI, ADMIN_ROLE_NAME, AUTHOR_REPEAT_PREVENTION
+from config import (BOT_TOKEN, REACTION_EMOJI, ADMIN_ROLE_NAME, AUTHOR_REPEAT_PREVENTION, RANDOM_QUOTE_MODE, AUTO_SHARD,
+                    SHARD_COUNT, SHARD_IDS, LOG_LEVEL, METRICS_HOST, METRICS_PORT, RECURRING_QUOTES_FILE)
+import backfill
 import database
+import export
+import metrics
+import utils
+from scheduler import RecurringQuoteScheduler
+
+log = logging.getLogger("quotebot")
+
+# Records each slash command's handler latency, labelled by command function name.
+timed_command = metrics.timed(metrics.COMMAND_LATENCY, "command")
+
+async def sync_commands_if_changed():
+    """
+    Syncs the global command tree with Discord, but only when the command definitions changed
+    since the last sync. Syncing is a rate-limited API call, and most restarts change nothing.
+    """
+    payload = {
+        "application_id": bot.application_id,
+        "commands": [command.to_dict(bot.tree) for command in bot.tree.get_commands()],
+    }
+    tree_hash = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    if tree_hash == await database.get_meta("command_tree_hash"):
+        log.info("Command tree unchanged; skipping sync")
+        return
+    try:
+        synced = await bot.tree.sync()
+    except discord.HTTPException:
+        log.exception("Failed to sync commands")
+        return
+    await database.set_meta("command_tree_hash", tree_hash)
+    log.info("Synced %d command(s)", len(synced))
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
 intents.messages = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-# In-memory dictionary to track last shown author per channel
-last_shown_authors = {}
-
-RECURRING_QUOTES = [
-    {
-        "name": "weekly_monday_quote",
-        "time": time(hour=12, minute=0, second=0, tzinfo=timezone.utc),
-        "day": 0,
-        "channel_id": 123456789012345678,  # Replace with your actual channel ID
-        "message": "Happy Monday friends"
-    },
-    {
-        "name": "wednesday_quote",
-        "time": time(hour=15, minute=30, second=0, tzinfo=timezone.utc),
-        "day": 2,
-        "channel_id": 123456789012345678,
-        "message": "Hump Day Wisdom"
-    },
-]
+# With AUTO_SHARD the bot runs as an AutoShardedBot; SHARD_COUNT/SHARD_IDS split the guilds across processes.
+class QuoteBot(commands.AutoShardedBot if AUTO_SHARD else commands.Bot):
+    metrics_server = None
+    embed_warm_task = None
+    index_load_task = None
+
+    async def setup_hook(self):
+        # Runs once per process, before the gateway connects; on_ready fires again on every reconnect.
+        await database.connect()
+        await database.migrate()
+        await sync_commands_if_changed()
+        if METRICS_PORT:
+            self.metrics_server = await metrics.start_http_server(METRICS_HOST, METRICS_PORT)
+        # Built in worker threads; commands that need an index before it is ready wait for it or skip it.
+        self.index_load_task = asyncio.create_task(database.load_indexes())
+        # These wait for the first READY themselves.
+        recurring_quotes.start()
+        self.embed_warm_task = asyncio.create_task(warm_embed_cache())
+
+    async def close(self):
+        recurring_quotes.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        await super().close()
+        await database.close()
+        utils.shutdown_executor()
+
+shard_options = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if AUTO_SHARD else {}
+bot = QuoteBot(command_prefix="!", intents=intents, **shard_options)
+
+# In-memory state per shard: shard_id -> {channel_id: last shown author id}
+last_shown_authors = defaultdict(dict)
+
+# Refreshed attachment URLs, keyed by message ID. Discord CDN links are signed and expire after a while.
+attachment_url_cache = utils.TTLCache("attachment_url", maxsize=2048, ttl=12 * 3600)
+# Start refreshing a stored URL in the background once it is this close (seconds) to expiring.
+ATTACHMENT_REFRESH_AHEAD = 3600
+# How long a display waits for an already-expired URL to be refreshed before showing the quote without it.
+ATTACHMENT_REFRESH_TIMEOUT = 3
+# How long (seconds) a failed refresh is remembered before the message is fetched again.
+ATTACHMENT_FAILURE_TTL = 300
+_attachment_refreshes = {}  # message_id -> in-flight refresh task
+
+async def refresh_attachment(guild_id, channel_id, message_id):
+    """Re-fetches the quoted message to get a fresh attachment URL, storing it in the database and cache."""
+    guild = bot.get_guild(guild_id)
+    channel = guild.get_channel(channel_id) if guild else None
+    if not channel:
+        return None
+    metrics.DISCORD_API_CALLS.inc(call="fetch_message", source="format_quote_embed")
+    try:
+        message = await channel.fetch_message(message_id)
+    except discord.NotFound:
+        # The source message is gone; remember there is nothing to fetch.
+        await database.update_quote_attachment(message_id, None, "")
+        invalidate_quote_embed(message_id)
+        return None
+    except (discord.Forbidden, discord.HTTPException) as e:
+        log.warning("Failed to fetch message for attachment: %s", e)
+        # Remember the failure briefly so every display doesn't retry the same fetch.
+        attachment_url_cache.set(message_id, "", expires_at=datetime.now(timezone.utc).timestamp() + ATTACHMENT_FAILURE_TTL)
+        return None
+
+    url, content_type = utils.first_image_attachment(message)
+    await database.update_quote_attachment(message_id, url, content_type)
+    invalidate_quote_embed(message_id)
+    if url:
+        attachment_url_cache.set(message_id, url, expires_at=utils.attachment_expiry(url))
+    return url
+
+def schedule_attachment_refresh(guild_id, channel_id, message_id):
+    """Starts a background refresh for the message, or returns the one already running."""
+    task = _attachment_refreshes.get(message_id)
+    if task is None:
+        task = asyncio.create_task(refresh_attachment(guild_id, channel_id, message_id))
+        _attachment_refreshes[message_id] = task
+        task.add_done_callback(lambda _: _attachment_refreshes.pop(message_id, None))
+    return task
+
+async def resolve_attachment_url(guild_id, channel_id, message_id, attachment_url, attachment_content_type):
+    """Returns a usable image URL for a quote, normally without any Discord API call."""
+    if attachment_content_type == "":
+        return None  # Known to have no image.
+    if attachment_content_type is not None and attachment_url:
+        expires_at = utils.attachment_expiry(attachment_url)
+        if expires_at is None or expires_at - datetime.now(timezone.utc).timestamp() > ATTACHMENT_REFRESH_AHEAD:
+            return attachment_url
+
+    cached_url = attachment_url_cache.get(message_id)
+    if cached_url:
+        return cached_url
+    if cached_url == "":
+        # A refresh failed recently; use the stored URL while it is still valid rather than retrying.
+        expires_at = utils.attachment_expiry(attachment_url) if attachment_url else None
+        if attachment_url and (expires_at is None or expires_at > datetime.now(timezone.utc).timestamp()):
+            return attachment_url
+        return None
+
+    task = schedule_attachment_refresh(guild_id, channel_id, message_id)
+    if attachment_url and attachment_content_type is not None:
+        expires_at = utils.attachment_expiry(attachment_url)
+        if expires_at is None or expires_at > datetime.now(timezone.utc).timestamp():
+            return attachment_url  # Still valid for now; the refresh finishes in the background.
+    # Expired, or a quote saved before attachments were stored: wait briefly for the refresh.
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=ATTACHMENT_REFRESH_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
 
 async def format_quote_embed(quote):
-    """Helper function to create a quote embed, including attachments if present."""
+    """Helper function to create an embed for a database.Quote, including attachments if present."""
     if not quote:
         return None
-    quote_id, message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id, added_at = quote
 
     embed = discord.Embed(
-        description=content if content else "[Image-only quote]",
+        description=quote.content if quote.content else "[Image-only quote]",
         color=discord.Color.blurple()
     )
-    embed.set_author(name=author_name, url=jump_url)
+    embed.set_author(name=quote.author_name, url=quote.jump_url)
 
-    guild = bot.get_guild(guild_id)
-    if guild:
-        channel = guild.get_channel(channel_id)
-        if channel:
-            try:
-                message = await channel.fetch_message(message_id)
-                if message.attachments:
-                    for attachment in message.attachments:
-                        if attachment.content_type.startswith('image/'):
-                            embed.set_image(url=attachment.url)
-                            break
-            except (discord.NotFound, discord.Forbidden, discord.HTTPException) as e:
-                print(f"Failed to fetch message for attachment: {e}")
+    image_url = await resolve_attachment_url(quote.guild_id, quote.channel_id, quote.message_id,
+                                             quote.attachment_url, quote.attachment_content_type)
+    if image_url:
+        embed.set_image(url=image_url)
+
+    return embed
 
+# Rendered embeds keyed by message ID, so repeat displays skip both the database and format_quote_embed.
+embed_cache = utils.TTLCache("embed", maxsize=1024, ttl=6 * 3600)
+# How many of the most displayed quotes are rendered into embed_cache at startup.
+EMBED_WARM_COUNT = 100
+# message ID -> invalidation count; an embed whose render overlapped an invalidation of the same
+# quote isn't cached, as it may be stale. Only quotes are ever counted, so this stays small.
+_embed_generations = defaultdict(int)
+
+def invalidate_quote_embed(message_id):
+    _embed_generations[message_id] += 1
+    embed_cache.pop(message_id)
+
+async def message_changed(message_id):
+    """
+    Drops what is cached for an edited or deleted message. Most edits (link unfurls, other bots)
+    aren't of quotes, so they are filtered out with the in-memory quote index first.
+    """
+    if message_id in embed_cache or message_id in attachment_url_cache or await database.quote_exists(message_id):
+        invalidate_quote_embed(message_id)
+        attachment_url_cache.pop(message_id)
+
+async def render_quote_embed(message_id, quote=None):
+    """
+    Returns the embed for a quote from embed_cache, rendering and caching it on a miss, or None if
+    the quote doesn't exist. The quote row is only fetched on a miss, unless it is passed in.
+    """
+    embed = embed_cache.get(message_id)
+    if embed is not None:
+        return embed
+    generation = _embed_generations.get(message_id, 0)
+    if quote is None:
+        quote = await database.get_quote_by_message_id(message_id)
+    embed = await format_quote_embed(quote)
+    if embed is not None and generation == _embed_generations.get(message_id, 0):
+        # Expire with the image URL, in time for the background refresh to replace it.
+        expires_at = utils.attachment_expiry(embed.image.url) if embed.image.url else None
+        embed_cache.set(message_id, embed,
+                        expires_at=None if expires_at is None else expires_at - ATTACHMENT_REFRESH_AHEAD)
     return embed
 
+async def quote_embed(message_id, quote=None):
+    """Returns the embed for displaying a quote (see render_quote_embed) and counts the display."""
+    embed = await render_quote_embed(message_id, quote)
+    if embed is not None:
+        await database.record_quote_display(message_id)
+    return embed
+
+async def warm_embed_cache():
+    """Renders the most displayed quotes ahead of time, so they are cache hits right after a restart."""
+    await bot.wait_until_ready()  # Attachment refreshes need the guild cache.
+    for quote in await database.get_popular_quotes(EMBED_WARM_COUNT):
+        await render_quote_embed(quote.message_id, quote)
+    log.info("Pre-rendered %d popular quote(s)", len(embed_cache))
+
 @bot.event
 async def on_ready():
-    print(f"Logged in as {bot.user.name} (ID: {bot.user.id})")
-    await database.create_tables()
-    try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
-    except Exception as e:
-        print(e)
-    print("------")
-    for recurring_quote in RECURRING_QUOTES:
-        task = getattr(tasks, recurring_quote["name"])
-        task.start()
+    log.info("Logged in as %s (ID: %s)", bot.user.name, bot.user.id)
+
+# Message IDs whose quote is currently being added, so simultaneous reactions only add it once.
+pending_quote_messages = set()
+
+@bot.event
+async def on_shard_ready(shard_id):
+    log.info("Shard %s ready", shard_id)
+
+@bot.event
+async def on_shard_resumed(shard_id):
+    log.info("Shard %s resumed", shard_id)
 
 @bot.event
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
-    if payload.user_id == bot.user.id:
+    # Cheap checks straight off the gateway payload first: most reactions are not quote reactions.
+    if not isinstance(REACTION_EMOJI, (int, str)):
+        log.error("Emoji configuration error")
+        return
+    if not utils.is_quote_emoji(payload.emoji):
+        return
+    if payload.user_id == bot.user.id or payload.guild_id is None:
         return
+    if payload.message_id in pending_quote_messages:
+        return
+
+    # Claimed before the first await, so simultaneous reactions (e.g. while the quote index is still
+    # loading after a restart) fetch the message once between them.
+    pending_quote_messages.add(payload.message_id)
+    try:
+        if await database.quote_exists(payload.message_id):
+            log.debug("Quote already exists")
+            return
+        await add_reaction_quote(payload)
+    finally:
+        pending_quote_messages.discard(payload.message_id)
 
+async def add_reaction_quote(payload):
     guild = bot.get_guild(payload.guild_id)
     if not guild:
-        print(f"Guild not found: {payload.guild_id}")
+        log.warning("Guild not found: %s", payload.guild_id)
         return
     channel = guild.get_channel(payload.channel_id)
     if not channel:
-        print(f"Channel not found: {payload.channel_id}")
+        log.warning("Channel not found: %s", payload.channel_id)
         return
 
+    metrics.DISCORD_API_CALLS.inc(call="fetch_message", source="on_raw_reaction_add")
     try:
         message = await channel.fetch_message(payload.message_id)
     except discord.NotFound:
-        print(f"Message not found: {payload.message_id}")
+        log.info("Message not found: %s", payload.message_id)
         return
     except discord.Forbidden:
-        print(f"Bot lacks permission to fetch message: {payload.message_id}")
+        log.warning("Bot lacks permission to fetch message: %s", payload.message_id)
         return
     except discord.HTTPException as e:
-        print(f"HTTP error fetching message: {payload.message_id} - {e}")
+        log.warning("HTTP error fetching message: %s - %s", payload.message_id, e)
         return
 
     if message.author.bot:
-        print(f"Ignoring reaction on bot message: {message.id}")
+        log.debug("Ignoring reaction on bot message: %s", message.id)
         return
 
-    if isinstance(REACTION_EMOJI, int):  # Custom Emoji
-        if payload.emoji.id == REACTION_EMOJI:
-            existing_quote = await database.get_quote_by_message_id(message.id)
-            if existing_quote is None:
-                await database.add_quote(message.id, guild.id, channel.id, message.author.id, message.author.name,
-                                         message.content, message.jump_url, payload.user_id)
-                print(f"Quote added: {message.content}")
-                embed = await format_quote_embed(await database.get_quote_by_message_id(message.id))
-                if embed:
-                    await channel.send("Immortalized", embed=embed)
-            else:
-                print("Quote already exists")
-    elif isinstance(REACTION_EMOJI, str):  # Standard Emoji
-        if payload.emoji.name == REACTION_EMOJI:
-            existing_quote = await database.get_quote_by_message_id(message.id)
-            if existing_quote is None:
-                await database.add_quote(message.id, guild.id, channel.id, message.author.id, message.author.name,
-                                         message.content, message.jump_url, payload.user_id)
-                print(f"Quote added: {message.content}")
-                embed = await format_quote_embed(await database.get_quote_by_message_id(message.id))
-                if embed:
-                    await channel.send("Quote added yabish!", embed=embed)
-            else:
-                print("Quote already exists")
-    else:
-        print("Emoji configuration error")
+    quote = await database.add_quote(message.id, guild.id, channel.id, message.author.id, message.author.name,
+                                     message.content, message.jump_url, payload.user_id,
+                                     *utils.first_image_attachment(message))
+    if quote is None:
+        log.debug("Quote already exists")
+        return
+    log.info("Quote added: %s", message.id)
+    embed = await quote_embed(message.id, quote)
+    if embed:
+        confirmation = "Immortalized" if isinstance(REACTION_EMOJI, int) else "Quote added yabish!"
+        metrics.DISCORD_API_CALLS.inc(call="send", source="on_raw_reaction_add")
+        await channel.send(confirmation, embed=embed)
+
+@bot.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    # Quotes keep the text they were saved with, but an edit can remove the image a cached embed shows.
+    await message_changed(payload.message_id)
+
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    await message_changed(payload.message_id)
+
+@bot.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    for message_id in payload.message_ids:
+        await message_changed(message_id)
 
 @bot.tree.command(name="randomquote", description="Displays a random quote.")
+@app_commands.guild_only()
+@timed_command
 async def randomquote(interaction: discord.Interaction):
     quote = None
+    guild_id = interaction.guild_id
     channel_id = interaction.channel_id
-    if AUTHOR_REPEAT_PREVENTION:
-        last_author = last_shown_authors.get(channel_id)
-        print(f"Last shown author in channel {channel_id}: {last_author}")
+    shard_authors = last_shown_authors[interaction.guild.shard_id]
+    if RANDOM_QUOTE_MODE == "rotation":
+        quote = await database.deal_rotation_quote(guild_id, channel_id)
+    elif AUTHOR_REPEAT_PREVENTION:
+        last_author = shard_authors.get(channel_id)
+        log.debug("Last shown author in channel %s: %s", channel_id, last_author)
         if last_author:
-            available_count = await database.get_available_quotes_count(last_author, channel_id)
-            print(f"Quotes available excluding author {last_author} in channel {channel_id}: {available_count}")
-            quote = await database.get_random_quote_not_by_author(last_author, channel_id)
+            quote = await database.get_random_quote_not_by_author(last_author, channel_id, guild_id)
             if quote is None:
-                print(f"No quotes found excluding author {last_author} in channel {channel_id}, falling back")
-                quote = await database.get_random_quote()
+                log.debug("No quotes found excluding author %s in channel %s, falling back", last_author, channel_id)
+                quote = await database.get_random_quote(guild_id)
         else:
-            quote = await database.get_random_quote()
+            quote = await database.get_random_quote(guild_id)
     else:
-        quote = await database.get_random_quote()
+        quote = await database.get_random_quote(guild_id)
 
     if quote:
-        quote_id, message_id, guild_id, _, author_id, author_name, content, jump_url, _, _ = quote
-        last_shown_authors[channel_id] = author_id  # Update last shown author
-        print(f"Selected quote: {quote}")
-        embed = await format_quote_embed(quote)
+        shard_authors[channel_id] = quote.author_id  # Update last shown author
+        log.debug("Selected quote: %s", quote.id)
+        embed = await quote_embed(quote.message_id, quote)
         await interaction.response.send_message(embed=embed)
     else:
         await interaction.response.send_message("No quotes found!", ephemeral=True)
 
+PAGE_SIZE = 25  # Discord allows at most 25 options per select menu.
+
+def option_label(text, fallback="[Image-only quote]"):
+    """Select option labels must be 1-100 characters."""
+    return (text or fallback)[:100]
+
+class PagedSelect(discord.ui.View):
+    """
+    A select menu over keyset-paginated results, with Previous/Next buttons.
+
+    `fetch_page(after)` returns up to PAGE_SIZE + 1 (key, value, label) rows starting after the
+    `after` key (None for the first page); the extra row only signals that there is a next page.
+    Only the current page is kept, plus the start key of each page before it for going back.
+    `on_select(interaction, value)` handles the chosen option.
+    """
+
+    def __init__(self, title, placeholder, fetch_page, on_select):
+        super().__init__()
+        self.title = title
+        self._fetch_page = fetch_page
+        self._on_select = on_select
+        self._previous_starts = []
+        self._start = self._next_start = None
+
+        self.select = discord.ui.Select(placeholder=placeholder)
+        self.select.callback = self._selected
+        self.previous_button = discord.ui.Button(label="Previous", style=discord.ButtonStyle.secondary)
+        self.previous_button.callback = self._previous
+        self.next_button = discord.ui.Button(label="Next", style=discord.ButtonStyle.secondary)
+        self.next_button.callback = self._next
+        self.add_item(self.select)
+
+    @property
+    def page_number(self):
+        return len(self._previous_starts) + 1
+
+    @property
+    def content(self):
+        if self._next_start is None and not self._previous_starts:
+            return self.title
+        return f"{self.title} (page {self.page_number})"
+
+    async def load(self, after=None):
+        """Fetches the page after `after`. Returns False if it is empty."""
+        rows = await self._fetch_page(after)
+        page = rows[:PAGE_SIZE]
+        self._start = after
+        self._next_start = page[-1][0] if len(rows) > PAGE_SIZE else None
+        self.select.options = [discord.SelectOption(label=label, value=str(value)) for _, value, label in page]
+
+        # Only show the buttons once there is more than one page.
+        self.remove_item(self.previous_button)
+        self.remove_item(self.next_button)
+        if self._previous_starts or self._next_start is not None:
+            self.previous_button.disabled = not self._previous_starts
+            self.next_button.disabled = self._next_start is None
+            self.add_item(self.previous_button)
+            self.add_item(self.next_button)
+        return bool(page)
+
+    async def _selected(self, interaction: discord.Interaction):
+        await self._on_select(interaction, int(self.select.values[0]))
+
+    async def _previous(self, interaction: discord.Interaction):
+        await self.load(self._previous_starts.pop())
+        await interaction.response.edit_message(content=self.content, view=self)
+
+    async def _next(self, interaction: discord.Interaction):
+        self._previous_starts.append(self._start)
+        if not await self.load(self._next_start):
+            # Everything after this page was deleted since it was shown.
+            await self.load(self._previous_starts.pop())
+        await interaction.response.edit_message(content=self.content, view=self)
+
+async def display_selected_quote(interaction: discord.Interaction, message_id):
+    embed = await quote_embed(message_id)
+    if embed is None:
+        await interaction.response.edit_message(content="That quote no longer exists.", view=None)
+        return
+    await interaction.channel.send(embed=embed)
+    await interaction.response.edit_message(content="Quote displayed to the channel!", view=None)
+
+def author_quotes_view(author_id, guild_id):
+    async def fetch_page(after):
+        quotes = await database.get_quotes_by_author_id(author_id, guild_id, after=after, limit=PAGE_SIZE + 1)
+        return [(quote.id, quote.message_id, option_label(quote.label)) for quote in quotes]
+
+    return PagedSelect("Quotes by selected author:", "Select a quote", fetch_page, display_selected_quote)
+
 @bot.tree.command(name="search", description="Searches for quotes containing a specific term.")
 @app_commands.describe(term="The term to search for.")
+@app_commands.guild_only()
+@timed_command
 async def search(interaction: discord.Interaction, term: str):
-    quotes = await database.get_quotes_by_search_term(term)
-    if not quotes:
+    guild_id = interaction.guild_id
+
+    async def fetch_page(after):
+        quotes = await database.get_quotes_by_search_term(term, guild_id, after=after, limit=PAGE_SIZE + 1)
+        rows = [((quote.rank, quote.id), quote.message_id, option_label(quote.label)) for quote in quotes]
+        if after is None and len(rows) < PAGE_SIZE:
+            # All matches fit on one page; top it up with fuzzy matches so small typos still find something.
+            seen = {message_id for _, message_id, _ in rows}
+            fuzzy_quotes = await database.fuzzy_search_quotes(term, guild_id, limit=PAGE_SIZE)
+            rows += [(None, quote.message_id, option_label(quote.label)) for quote in fuzzy_quotes
+                     if quote.message_id not in seen][:PAGE_SIZE - len(rows)]
+        return rows
+
+    view = PagedSelect("Search Results:", "Select a quote", fetch_page, display_selected_quote)
+    if not await view.load():
         await interaction.response.send_message("No quotes found matching that term.", ephemeral=True)
         return
-
-    options = []
-    for quote in quotes[:25]:
-        quote_id, message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id, added_at = quote
-        label = (content or "[Image-only quote]")[:100]  # Ensure label is never empty or too long
-        if len(label) < 1:  # Edge case fallback
-            label = "[Empty Quote]"
-        options.append(discord.SelectOption(label=label, value=str(message_id)))
-
-    select = discord.ui.Select(placeholder="Select a quote", options=options)
-
-    async def select_callback(interaction: discord.Interaction):
-        selected_message_id = int(select.values[0])
-        quote = await database.get_quote_by_message_id(selected_message_id)
-        embed = await format_quote_embed(quote)
-        await interaction.channel.send(embed=embed)
-        await interaction.response.edit_message(content="Quote displayed to the channel!", view=None)
-
-    select.callback = select_callback
-    view = discord.ui.View()
-    view.add_item(select)
-    await interaction.response.send_message("Search Results:", view=view, ephemeral=True)
+    await interaction.response.send_message(view.content, view=view, ephemeral=True)
 
 @bot.tree.command(name="search_author", description="Searches for quotes by selecting an author from a dropdown.")
-async def search_author(interaction: discord.Interaction):
-    authors = await database.get_all_unique_authors()
-    if not authors:
-        await interaction.response.send_message("No authors found in the quote database.", ephemeral=True)
-        return
-
-    options = []
-    for author_id, author_name in authors[:25]:
-        options.append(discord.SelectOption(label=author_name, value=str(author_id)))
-
-    select = discord.ui.Select(placeholder="Select an author", options=options)
-
-    async def select_callback(interaction: discord.Interaction):
-        selected_author_id = int(select.values[0])
-        quotes = await database.get_quotes_by_author_id(selected_author_id)
-        if not quotes:
+@app_commands.describe(name="Start typing an author's name to pick them; leave empty to list authors.")
+@app_commands.guild_only()
+@timed_command
+async def search_author(interaction: discord.Interaction, name: str = None):
+    guild_id = interaction.guild_id
+    if name and name.isdigit():
+        # Picked from the autocomplete list, which submits the author id.
+        author = await database.get_author(int(name), guild_id)
+        if author is not None:
+            quote_view = author_quotes_view(author.author_id, guild_id)
+            if await quote_view.load():
+                await interaction.response.send_message(quote_view.content, view=quote_view, ephemeral=True)
+                return
+
+    async def fetch_page(after):
+        if name:
+            # Matches for a typed name are capped at one page.
+            authors = await database.find_authors(name, guild_id, limit=PAGE_SIZE)
+        else:
+            authors = await database.get_all_unique_authors(guild_id, after=after, limit=PAGE_SIZE + 1)
+        return [((author.author_name, author.author_id), author.author_id,
+                 option_label(author.author_name, "[Unknown author]"))
+                for author in authors]
+
+    async def author_selected(interaction: discord.Interaction, author_id):
+        quote_view = author_quotes_view(author_id, interaction.guild_id)
+        if not await quote_view.load():
             await interaction.response.edit_message(content="No quotes found for this author.", view=None)
             return
+        await interaction.response.edit_message(content=quote_view.content, view=quote_view)
+
+    view = PagedSelect("Select an author:", "Select an author", fetch_page, author_selected)
+    if not await view.load():
+        message = "No authors matching that name." if name else "No authors found in the quote database."
+        await interaction.response.send_message(message, ephemeral=True)
+        return
+    await interaction.response.send_message(view.content, view=view, ephemeral=True)
 
-        quote_options = []
-        for quote in quotes[:25]:
-            quote_id, message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id, added_at = quote
-            label = (content or "[Image-only quote]")[:100]  # Ensure label is never empty or too long
-            if len(label) < 1:
-                label = "[Empty Quote]"
-            quote_options.append(discord.SelectOption(label=label, value=str(message_id)))
-
-        quote_select = discord.ui.Select(placeholder="Select a quote", options=quote_options)
-
-        async def quote_select_callback(interaction: discord.Interaction):
-            selected_message_id = int(quote_select.values[0])
-            quote = await database.get_quote_by_message_id(selected_message_id)
-            embed = await format_quote_embed(quote)
-            await interaction.channel.send(embed=embed)
-            await interaction.response.edit_message(content="Quote displayed to the channel!", view=None)
-
-        quote_select.callback = quote_select_callback
-        quote_view = discord.ui.View()
-        quote_view.add_item(quote_select)
-        await interaction.response.edit_message(content="Quotes by selected author:", view=quote_view)
-
-    select.callback = select_callback
-    view = discord.ui.View()
-    view.add_item(select)
-    await interaction.response.send_message("Select an author:", view=view, ephemeral=True)
+@search_author.autocomplete("name")
+@timed_command
+async def search_author_autocomplete(interaction: discord.Interaction, current: str):
+    authors = await database.find_authors(current, interaction.guild_id, limit=PAGE_SIZE)
+    return [app_commands.Choice(name=f"{author.author_name or '[Unknown author]'} ({author.quote_count})"[:100],
+                                value=str(author.author_id))
+            for author in authors]
 
 @bot.tree.command(name="deletequote", description="Delete a quote that you added or authored, or if you have the admin role.")
 @app_commands.describe(message_link="The link to the original message of the quote.")
+@app_commands.guild_only()
+@timed_command
 async def deletequote(interaction: discord.Interaction, message_link: str):
     try:
         message_id = int(message_link.split('/')[-1])
@@ -249,21 +528,24 @@ async def deletequote(interaction: discord.Interaction, message_link: str):
             "Invalid message link format. Please provide a valid Discord message link.", ephemeral=True)
         return
 
-    quote = await database.get_quote_by_message_id(message_id)
-    if not quote:
+    owner = await database.get_quote_owner(message_id)
+    # Quotes from other servers are invisible here, so roles in this server can't delete them.
+    if not owner or owner.guild_id != interaction.guild_id:
         await interaction.response.send_message("Quote not found.", ephemeral=True)
         return
 
-    quote_id, message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id, added_at = quote
     is_admin = any(role.name == ADMIN_ROLE_NAME for role in interaction.user.roles)
-    if interaction.user.id == adder_user_id or interaction.user.id == author_id or is_admin:
+    if interaction.user.id in (owner.adder_user_id, owner.author_id) or is_admin:
         await database.delete_quote(message_id)
+        invalidate_quote_embed(message_id)
         await interaction.response.send_message("Quote deleted successfully!", ephemeral=True)
     else:
         await interaction.response.send_message("You don't have permission to delete this quote.", ephemeral=True)
 
 @bot.tree.command(name="manual_add", description="Manually add a quote using a message link.")
 @app_commands.describe(message_link="The link to the Discord message.")
+@app_commands.guild_only()
+@timed_command
 async def manual_add(interaction: discord.Interaction, message_link: str):
     try:
         link_parts = message_link.split('/')
@@ -271,8 +553,12 @@ async def manual_add(interaction: discord.Interaction, message_link: str):
         channel_id = int(link_parts[-2])
         message_id = int(link_parts[-1])
 
+        if await database.quote_exists(message_id):
+            await interaction.response.send_message("That quote has already been added.", ephemeral=True)
+            return
+
         guild = bot.get_guild(guild_id)
-        if not guild:
+        if not guild or guild.id != interaction.guild_id:
             await interaction.response.send_message("Invalid message link: Could not find the server.", ephemeral=True)
             return
 
@@ -281,6 +567,7 @@ async def manual_add(interaction: discord.Interaction, message_link: str):
             await interaction.response.send_message("Invalid message link: Could not find the channel.", ephemeral=True)
             return
 
+        metrics.DISCORD_API_CALLS.inc(call="fetch_message", source="manual_add")
         message = await channel.fetch_message(message_id)
     except (ValueError, IndexError):
         await interaction.response.send_message(
@@ -301,48 +588,127 @@ async def manual_add(interaction: discord.Interaction, message_link: str):
         await interaction.response.send_message("Cannot add quotes from bots.", ephemeral=True)
         return
 
-    existing_quote = await database.get_quote_by_message_id(message.id)
-    if existing_quote:
-        await interaction.response.send_message("That quote has already been added.", ephemeral=True)
-        return
-
-    await database.add_quote(
+    quote = await database.add_quote(
         message.id, message.guild.id, message.channel.id, message.author.id,
-        message.author.name, message.content, message.jump_url, interaction.user.id
+        message.author.name, message.content, message.jump_url, interaction.user.id,
+        *utils.first_image_attachment(message)
     )
+    if quote is None:
+        await interaction.response.send_message("That quote has already been added.", ephemeral=True)
+        return
 
-    embed = await format_quote_embed(await database.get_quote_by_message_id(message.id))
+    embed = await quote_embed(message.id, quote)
     if embed:
         await interaction.response.send_message("Quote added!", embed=embed)
 
+# Channel IDs with a /backfill currently running.
+running_backfills = set()
+
+@bot.tree.command(name="backfill", description="Admin only: import already-reacted quotes from a channel's history.")
+@app_commands.describe(channel="The channel to import from (defaults to this channel).")
+@app_commands.guild_only()
+@timed_command
+async def backfill_history(interaction: discord.Interaction, channel: discord.TextChannel = None):
+    is_admin = any(role.name == ADMIN_ROLE_NAME for role in interaction.user.roles)
+    if not is_admin:
+        await interaction.response.send_message("You don't have permission to run a backfill.", ephemeral=True)
+        return
+    channel = channel or interaction.channel
+    if channel.id in running_backfills:
+        await interaction.response.send_message("A backfill of that channel is already running.", ephemeral=True)
+        return
+
+    running_backfills.add(channel.id)
+    await interaction.response.send_message(
+        f"Backfilling {channel.mention}. This can take a while; progress is saved as it goes.", ephemeral=True)
+    try:
+        scanned, added = await backfill.backfill_channel(channel, interaction.user.id)
+        summary = f"Backfill of {channel.mention} finished: scanned {scanned} message(s), added {added} quote(s)."
+    except discord.Forbidden:
+        summary = f"Bot lacks permission to read history in {channel.mention}."
+    finally:
+        running_backfills.discard(channel.id)
+    try:
+        await interaction.followup.send(summary, ephemeral=True)
+    except discord.HTTPException as e:
+        # Interaction tokens expire after 15 minutes, long before a big backfill ends.
+        log.info("%s (could not notify: %s)", summary, e)
+
+@bot.tree.command(name="export", description="Admin only: export this server's quotes as a JSON Lines or CSV file.")
+@app_commands.describe(file_format="The file format to export.")
+@app_commands.choices(file_format=[app_commands.Choice(name="JSON Lines", value="jsonl"),
+                                   app_commands.Choice(name="CSV", value="csv")])
+@app_commands.guild_only()
+@timed_command
+async def export_quotes(interaction: discord.Interaction, file_format: app_commands.Choice[str]):
+    is_admin = any(role.name == ADMIN_ROLE_NAME for role in interaction.user.roles)
+    if not is_admin:
+        await interaction.response.send_message("You don't have permission to export quotes.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    path = export.default_path("export", file_format.value, interaction.guild_id)
+    count = await export.export_quotes(path, file_format.value, interaction.guild_id)
+    try:
+        if os.path.getsize(path) <= interaction.guild.filesize_limit:
+            await interaction.followup.send(f"Exported {count} quote(s).", file=discord.File(path), ephemeral=True)
+            os.remove(path)  # Uploaded; nothing needs the copy on the host.
+        else:
+            await interaction.followup.send(
+                f"Exported {count} quote(s) to `{path}` on the bot's host (too large to upload here).", ephemeral=True)
+    except discord.HTTPException as e:
+        log.info("Exported %d quote(s) to %s (could not notify: %s)", count, path, e)
+
+# Held while a /backup runs, so several multi-GB copies never run at once.
+backup_lock = asyncio.Lock()
+
+@bot.tree.command(name="backup", description="Bot owner only: write a snapshot of the quote database on the bot's host.")
+@app_commands.guild_only()
+@timed_command
+async def backup_database(interaction: discord.Interaction):
+    # The snapshot holds every server's quotes and lands on the host's disk, so server roles don't count here.
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("Only the bot's owner can back up the database.", ephemeral=True)
+        return
+    if backup_lock.locked():
+        await interaction.response.send_message("A backup is already running.", ephemeral=True)
+        return
+
+    async with backup_lock:
+        await interaction.response.send_message("Backing up the quote database...", ephemeral=True)
+        path, size = await export.backup_database()
+    summary = f"Backed up the quote database to `{path}` ({size / 2 ** 20:.1f} MiB)."
+    try:
+        await interaction.followup.send(summary, ephemeral=True)
+    except discord.HTTPException as e:
+        log.info("%s (could not notify: %s)", summary, e)
+
 # Commented out test command (confirmed working)
 # @bot.tree.command(name="test_recurring_quote", description="Test a recurring quote message in the current channel.")
 # async def test_recurring_quote(interaction: discord.Interaction):
-#     config = RECURRING_QUOTES[0]  # Picks "Happy Monday FRAG friends" by default
-#     quote = await database.get_random_quote()
-#     embed = await format_quote_embed(quote)
-#     if embed:
-#         await interaction.channel.send(config["message"], embed=embed)
+#     post = recurring_quotes.posts[0]  # Picks the first entry in RECURRING_QUOTES_FILE
+#     payload = await build_recurring_post(interaction.channel, post)
+#     if payload:
+#         content, embed = payload
+#         await interaction.channel.send(content, embed=embed)
 #     else:
 #         await interaction.channel.send("No quotes found to test!")
 #     await interaction.response.send_message("Triggered a test recurring quote!", ephemeral=True)
 
-def create_recurring_quote_task(config):
-    @tasks.loop(time=config["time"])
-    async def recurring_quote_task():
-        now = datetime.now(timezone.utc)
-        if now.weekday() == config["day"]:
-            channel = bot.get_channel(config["channel_id"])
-            if channel:
-                quote = await database.get_random_quote()
-                embed = await format_quote_embed(quote)
-                if embed:
-                    await channel.send(config["message"], embed=embed)
-
-    recurring_quote_task.__name__ = config["name"]
-    return recurring_quote_task
-
-for recurring_quote in RECURRING_QUOTES:
-    setattr(tasks, recurring_quote["name"], create_recurring_quote_task(recurring_quote))
-
-bot.run(BOT_TOKEN)
+async def build_recurring_post(channel, post):
+    """Picks the quote for a scheduled post and builds its embed; called by the scheduler ahead of time."""
+    if RANDOM_QUOTE_MODE == "rotation":
+        quote = await database.deal_rotation_quote(channel.guild.id, channel.id)
+    else:
+        quote = await database.get_random_quote(channel.guild.id)
+    if quote is None:
+        return None
+    embed = await quote_embed(quote.message_id, quote)
+    if embed is None:
+        return None
+    return post.message, embed
+
+recurring_quotes = RecurringQuoteScheduler(bot, RECURRING_QUOTES_FILE, build_recurring_post)
+
+if __name__ == "__main__":
+    bot.run(BOT_TOKEN, log_level=logging.getLevelName(LOG_LEVEL), root_logger=True)
@@ -1,8 +1,28 @@
 # config.py
 BOT_TOKEN = "[YOUR BOT TOKEN HERE]"  # Replace with your actual bot token!
 DATABASE_FILE = "quotes.db"
+BACKUP_DIR = "backups"  # Where /backup, /export and export.py write their files by default.
+DB_READ_POOL_SIZE = 4  # Number of shared read connections (one extra connection handles all writes).
+WRITE_BATCH_SIZE = 64  # Max quote adds/deletes grouped into one transaction.
+WRITE_BATCH_DELAY = 0.005  # Seconds to wait for more writes before committing a batch.
+BACKFILL_PAGE_DELAY = 0  # Extra seconds to pause per 100 messages scanned by /backfill; discord.py handles rate limits.
 REACTION_EMOJI = 12345123451234512345 # ASCII EMOJI IN QUOTES "👍", OR CUSTOM EMOJI ID
 ADMIN_ROLE_NAME = "SuperAdmin"  # Replace with your desired admin role name
 WEEKLY_QUOTE_CHANNEL_ID = 134563456345634563456345 # Replace with your channel ID for weekly quote.
+RECURRING_QUOTES_FILE = "recurring_quotes.json"  # Scheduled quote posts; edits are picked up without a restart.
 # Add a toggle for the author repeat
-AUTHOR_REPEAT_PREVENTION = True #Set to False to allow same author to appear multiple times.
+# /randomquote: "rotation" deals every quote once per channel before reshuffling (and survives restarts);
+# "random" picks independently each time.
+RANDOM_QUOTE_MODE = "rotation"
+AUTHOR_REPEAT_PREVENTION = True #Set to False to allow same author to appear multiple times. Only used in "random" mode.
+# Fuzzy search: large scoring jobs run in a "thread" or "process" pool; None scores on the event loop.
+FUZZY_EXECUTOR = "thread"
+FUZZY_OFFLOAD_THRESHOLD = 500  # Index size (or candidate count) above which fuzzy matching is moved off the event loop.
+# Sharding: set AUTO_SHARD = True to run as an AutoShardedBot (recommended past ~1000 servers).
+AUTO_SHARD = False
+SHARD_COUNT = None  # None lets Discord choose the number of shards.
+SHARD_IDS = None  # e.g. [0, 1] to run only some shards in this process; requires SHARD_COUNT.
+# Logging and metrics
+LOG_LEVEL = "INFO"  # DEBUG, INFO, WARNING or ERROR.
+METRICS_PORT = None  # Set to a port (e.g. 9108) to serve Prometheus metrics at http://METRICS_HOST:METRICS_PORT/metrics.
+METRICS_HOST = "127.0.0.1"
@@ -1,101 +1,1246 @@
 # database.py
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import defaultdict, namedtuple
+from urllib.request import pathname2url
+
 import aiosqlite
 
-from config import DATABASE_FILE
+from config import DATABASE_FILE, DB_READ_POOL_SIZE, WRITE_BATCH_DELAY, WRITE_BATCH_SIZE
+import metrics
+from sampling import QuoteIndex, Rotation
+from utils import FuzzyIndex, fuzz, score_candidates
+
+log = logging.getLogger(__name__)
+
+# Records the latency of each public query function, labelled by function name.
+timed_query = metrics.timed(metrics.DB_QUERY_LATENCY, "query")
+
+# Applied to every connection when it is opened.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # readers never block the writer and vice versa
+    "PRAGMA synchronous=NORMAL",  # safe with WAL, avoids an fsync per commit
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache per connection
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+class ConnectionManager:
+    """Long-lived SQLite connections: one writer plus a small pool of readers.
+
+    Every aiosqlite connection owns a worker thread, so they are opened once at
+    startup and shared for the lifetime of the bot instead of per query.
+    """
+
+    def __init__(self, path, read_pool_size):
+        self.path = path
+        self.read_pool_size = max(1, read_pool_size)
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._connections = []
+        self.writes = WriteQueue(self)
+
+    async def open(self):
+        self._writer = await self._open_connection()
+        for _ in range(self.read_pool_size):
+            reader = await self._open_connection()
+            await reader.execute("PRAGMA query_only=ON")
+            self._readers.put_nowait(reader)
+        self.writes.start()
+
+    async def _open_connection(self):
+        db = await aiosqlite.connect(self.path)
+        for pragma in CONNECTION_PRAGMAS:
+            await db.execute(pragma)
+        self._connections.append(db)
+        return db
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        db = await self._readers.get()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                # Also covers a failed COMMIT (e.g. a full disk), which would otherwise leave the
+                # transaction open and make every later BEGIN fail.
+                try:
+                    await self._writer.rollback()
+                except Exception:
+                    log.exception("Rollback failed")
+                raise
+
+    async def close(self):
+        await self.writes.drain()
+        async with self._write_lock:
+            for db in self._connections:
+                await db.close()
+            self._connections.clear()
+
+class WriteQueue:
+    """
+    Group commit for the writer connection.
+
+    Callers submit small write operations; a background task collects whatever arrives within
+    WRITE_BATCH_DELAY seconds (up to WRITE_BATCH_SIZE operations) and runs them in a single
+    transaction. Each operation gets its own savepoint, so one failing statement doesn't take the
+    rest of the batch down with it. A caller's await only returns once its batch has committed, so
+    whatever it reads next already includes its write.
+    """
+
+    def __init__(self, manager, max_batch=WRITE_BATCH_SIZE, max_delay=WRITE_BATCH_DELAY):
+        self._manager = manager
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = asyncio.Queue()
+        self._task = None
+        self._stopping = False
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            self._task.add_done_callback(self._stopped)
+
+    def _stopped(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            log.error("The write queue stopped; further writes will fail", exc_info=task.exception())
+
+    @property
+    def running(self):
+        """True while submitted writes will still be committed, i.e. until drain() starts."""
+        return self._task is not None and not self._task.done() and not self._stopping
+
+    async def submit(self, operation, on_commit=None):
+        """
+        Runs `await operation(db)` in the next batch and returns its result once committed.
+
+        `on_commit(result)`, if given, runs right after the commit and before any other write can
+        start, which keeps the in-memory indexes in step with the database.
+        """
+        if not self.running:
+            raise RuntimeError("The write queue is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.put_nowait((operation, on_commit, future))
+        return await future
+
+    def submit_nowait(self, operation, on_commit=None):
+        """Queues a write without waiting for it to commit. Failures are logged instead of raised."""
+        if not self.running:
+            raise RuntimeError("The write queue is not running")
+        self._pending.put_nowait((operation, on_commit, None))
+
+    async def drain(self):
+        """Commits everything already submitted, then stops the background task. Later submits raise."""
+        if self._task is not None:
+            self._stopping = True
+            if not self._task.done():  # A task that already stopped was logged by _stopped.
+                self._pending.put_nowait(None)
+                await self._task
+            self._task = None
+            # Anything the task never got to (e.g. because it had crashed) fails rather than waits forever.
+            error = RuntimeError("The write queue stopped before this write was committed")
+            while not self._pending.empty():
+                item = self._pending.get_nowait()
+                if item is None:
+                    continue
+                operation, on_commit, future = item
+                if future is None:
+                    log.error("Queued write dropped: %s", error)
+                elif not future.done():
+                    future.set_exception(error)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._pending.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._pending.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await self._commit(batch)
+            except Exception as e:
+                # _commit settles its futures itself; this keeps the queue alive for the next batch.
+                log.exception("Write batch of %d operation(s) failed", len(batch))
+                for _, _, future in batch:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+
+    async def _commit(self, batch):
+        outcomes = []
+        try:
+            async with self._manager.write() as db:
+                await db.execute("BEGIN")
+                for operation, on_commit, future in batch:
+                    await db.execute("SAVEPOINT queued_write")
+                    try:
+                        result = await operation(db)
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO queued_write")
+                        outcomes.append((future, None, None, e))
+                    else:
+                        outcomes.append((future, on_commit, result, None))
+                    await db.execute("RELEASE queued_write")
+        except Exception as e:
+            log.exception("Write batch of %d operation(s) failed", len(batch))
+            for _, _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, on_commit, result, error in outcomes:
+            if error is None and on_commit is not None:
+                try:
+                    on_commit(result)
+                except Exception:
+                    # The write did commit, so the caller still gets its result.
+                    log.exception("on_commit callback failed")
+            if future is None:
+                if error is not None:
+                    log.error("Queued write failed", exc_info=error)
+                continue
+            if future.done():
+                continue  # The caller stopped waiting; the write still committed.
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        metrics.WRITE_BATCHES.observe(len(batch))
+
+def _begin_snapshot(db):
+    """Pins a plain sqlite3 connection to one read snapshot until it commits. Under WAL this doesn't block writers."""
+    db.execute("PRAGMA busy_timeout=5000")
+    db.execute("BEGIN")
+    db.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+def _build_and_close(build, db):
+    try:
+        return build(db)
+    finally:
+        db.close()
+
+class _LazyIndex:
+    """
+    An in-memory index built from the database on first use, or by load_indexes() at startup.
+
+    The build runs in a worker thread on its own sqlite3 connection, so neither the event loop nor
+    the writer waits for it. Its snapshot is taken while holding the writer, so every write commits
+    either before it or after the journal starts; journaled writes are replayed before the index is
+    published, and from then on on_added/on_removed keep it in step with each commit.
+    """
+
+    def __init__(self, name, build, on_added, on_removed):
+        self.name = name
+        self._build = build
+        self._on_added = on_added
+        self._on_removed = on_removed
+        self.index = None
+        self._journal = None
+        self._load = None
+
+    async def get(self, wait=True):
+        """Returns the index, starting a load if needed. With wait=False, returns None until it has loaded."""
+        if self.index is None:
+            if self._load is None or self._load.done():
+                self._load = asyncio.ensure_future(self._load_index())
+                self._load.add_done_callback(self._loaded)
+            if not wait:
+                return None
+            await asyncio.shield(self._load)
+        return self.index
+
+    def added(self, quote):
+        if self.index is not None:
+            self._on_added(self.index, *quote)
+        elif self._journal is not None:
+            self._journal.append((self._on_added, quote))
+
+    def removed(self, quote):
+        if self.index is not None:
+            self._on_removed(self.index, *quote)
+        elif self._journal is not None:
+            self._journal.append((self._on_removed, quote))
+
+    def reset(self):
+        if self._load is not None:
+            self._load.cancel()
+        self.index = self._journal = self._load = None
+
+    async def _load_index(self):
+        manager = _manager or await connect()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        db = sqlite3.connect(manager.path, isolation_level=None, check_same_thread=False)
+        try:
+            async with manager.write():
+                await loop.run_in_executor(None, _begin_snapshot, db)
+                journal = self._journal = []
+        except BaseException:
+            db.close()
+            raise
+        try:
+            index = await loop.run_in_executor(None, _build_and_close, self._build, db)
+        except BaseException:
+            if self._journal is journal:
+                self._journal = None
+            raise
+        if self._journal is not journal:
+            return  # reset() while building
+        for apply, quote in journal:
+            apply(index, *quote)
+        self.index = index
+        self._journal = None
+        log.info("Loaded the %s index in %.1fs", self.name, time.perf_counter() - started)
+
+    def _loaded(self, load):
+        if not load.cancelled() and load.exception() is not None:
+            log.error("Loading the %s index failed", self.name, exc_info=load.exception())
+
+# Build functions run in a worker thread (see _LazyIndex); the on_added/on_removed functions
+# receive the same arguments as _index_added/_index_removed.
+def _build_quote_index(db):
+    index = QuoteIndex()
+    for row in db.execute("SELECT id, message_id, guild_id, channel_id, author_id FROM quotes ORDER BY id"):
+        index.add(*row)
+    for guild_id, quote_id in db.execute("SELECT guild_id, quote_id FROM deleted_quotes"):
+        index.add_deleted(quote_id, guild_id)
+    return index
+
+def _quote_index_added(index, quote_id, message_id, guild_id, channel_id, author_id, author_name, content):
+    index.add(quote_id, message_id, guild_id, channel_id, author_id)
+
+def _quote_index_removed(index, quote_id, guild_id, author_id):
+    index.remove(quote_id)
+
+def _build_fuzzy_words(db):
+    words = FuzzyIndex()  # every distinct word in quote content, referenced once per quote containing it
+    if db.execute("SELECT 1 FROM sqlite_master WHERE name = 'quotes_fts'").fetchone() is None:
+        return words
+    # The words come straight from the full-text index, so no quote text is read or kept.
+    db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.quotes_fts_words USING fts5vocab(main, quotes_fts, 'col')")
+    for word, quote_count in db.execute("SELECT term, doc FROM temp.quotes_fts_words WHERE col = 'content'"):
+        words.add(word, word, quote_count)
+    return words
+
+def _fuzzy_word_added(words, quote_id, message_id, guild_id, channel_id, author_id, author_name, content):
+    for word in _words(content):
+        words.add(word, word)
+
+def _fuzzy_word_removed(words, quote_id, guild_id, author_id):
+    # Words of deleted quotes stay until the next load; they only cost an empty full-text match.
+    pass
+
+def _build_fuzzy_authors(db):
+    authors = defaultdict(FuzzyIndex)  # guild id -> FuzzyIndex of author id -> latest author name
+    for guild_id, author_id, author_name, quote_count in db.execute(
+            "SELECT guild_id, author_id, author_name, quote_count FROM authors"):
+        # One reference per quote, matching what _fuzzy_author_added/_fuzzy_author_removed maintain.
+        authors[guild_id].add(author_id, author_name, quote_count)
+    return authors
+
+def _fuzzy_author_added(authors, quote_id, message_id, guild_id, channel_id, author_id, author_name, content):
+    if guild_id is not None:
+        authors[guild_id].add(author_id, author_name)
+
+def _fuzzy_author_removed(authors, quote_id, guild_id, author_id):
+    if guild_id is not None:
+        authors[guild_id].remove(author_id)
+
+_manager = None
+_connect_lock = None
+_quote_index = _LazyIndex("quote", _build_quote_index, _quote_index_added, _quote_index_removed)
+_fuzzy_words = _LazyIndex("fuzzy word", _build_fuzzy_words, _fuzzy_word_added, _fuzzy_word_removed)
+_fuzzy_authors = _LazyIndex("fuzzy author", _build_fuzzy_authors, _fuzzy_author_added, _fuzzy_author_removed)
+_rotations = {}  # (guild id, channel id) -> Rotation, loaded from rotation_state on first use
+_fts_enabled = False
+
+# Weights passed to bm25(): matches in content rank above matches in author_name.
+FTS_COLUMN_WEIGHTS = (10.0, 1.0)
+
+async def connect(path=DATABASE_FILE, read_pool_size=DB_READ_POOL_SIZE):
+    """Open the shared connections. Safe to call more than once."""
+    global _manager, _connect_lock
+    if _connect_lock is None:
+        _connect_lock = asyncio.Lock()
+    async with _connect_lock:
+        if _manager is None:
+            manager = ConnectionManager(path, read_pool_size)
+            await manager.open()
+            _manager = manager
+    return _manager
+
+async def close():
+    """Close the shared connections; called when the bot shuts down."""
+    global _manager
+    if _manager is not None:
+        async with _connect_lock:
+            for index in (_quote_index, _fuzzy_words, _fuzzy_authors):
+                index.reset()
+            await _manager.close()
+            _manager = None
+            _rotations.clear()
+
+@contextlib.asynccontextmanager
+async def _reader():
+    manager = _manager or await connect()
+    async with manager.read() as db:
+        yield db
+
+async def _queued_write(operation, on_commit=None):
+    """Runs a write through the group-commit queue; see WriteQueue.submit."""
+    manager = _manager or await connect()
+    return await manager.writes.submit(operation, on_commit)
+
+async def _queued_write_nowait(operation):
+    """Queues a write without waiting for its commit; see WriteQueue.submit_nowait."""
+    manager = _manager or await connect()
+    manager.writes.submit_nowait(operation)
+
+@contextlib.asynccontextmanager
+async def _writer():
+    manager = _manager or await connect()
+    async with manager.write() as db:
+        yield db
+
+async def load_indexes():
+    """
+    Builds the in-memory sampling and search indexes in worker threads. The bot starts this at
+    startup, so the first command or reaction after a restart rarely has to wait for them.
+    """
+    await asyncio.gather(_quote_index.get(), _fuzzy_words.get(), _fuzzy_authors.get())
+
+def _index_added(*quote):
+    """Updates the in-memory indexes for a committed insert; `quote` is (id, message_id, guild_id,
+    channel_id, author_id, author_name, content)."""
+    _quote_index.added(quote)
+    _fuzzy_words.added(quote)
+    _fuzzy_authors.added(quote)
+
+def _index_removed(*quote):
+    """Updates the in-memory indexes for a committed delete of (id, guild_id, author_id)."""
+    _quote_index.removed(quote)
+    _fuzzy_words.removed(quote)
+    _fuzzy_authors.removed(quote)
+
+def _guild_clause(guild_id, keyword="WHERE", column="guild_id"):
+    """Returns the SQL condition and parameters restricting a query to one guild, or nothing when guild_id is None."""
+    if guild_id is None:
+        return "", ()
+    return f"{keyword} {column} = ?", (guild_id,)
+
+def _keyset_clause(after, columns, keyword="AND"):
+    """
+    Returns the SQL condition and parameters for the page that starts after the `after` key, a
+    tuple of values for `columns` in ORDER BY order, or nothing for the first page.
+    """
+    if after is None:
+        return "", ()
+    return f"{keyword} ({', '.join(columns)}) > ({', '.join('?' * len(columns))})", tuple(after)
+
+# Select menu labels are capped at 100 characters, so pages only read that much of each quote.
+LABEL_LENGTH = 100
+
+# Rows come back as these records rather than bare tuples. Each query selects exactly its record's
+# columns, so adding a column to a table never shifts what callers read.
+QUOTE_COLUMNS = ("id", "message_id", "guild_id", "channel_id", "author_id", "author_name", "content", "jump_url",
+                 "attachment_url", "attachment_content_type")
+Quote = namedtuple("Quote", QUOTE_COLUMNS)  # What displaying a quote needs.
+QuoteLabel = namedtuple("QuoteLabel", "id message_id label rank", defaults=(None,))  # One select menu option.
+QuoteOwner = namedtuple("QuoteOwner", "guild_id author_id adder_user_id")  # Who may delete a quote.
+Author = namedtuple("Author", "author_id author_name quote_count")
+EXPORT_COLUMNS = ("id", "message_id", "guild_id", "channel_id", "author_id", "author_name", "content", "jump_url",
+                  "adder_user_id", "added_at", "attachment_url", "attachment_content_type")
+ExportedQuote = namedtuple("ExportedQuote", EXPORT_COLUMNS)  # Every stored column, for exports.
+_QUOTE_SELECT = ", ".join(QUOTE_COLUMNS)
+
+@functools.cache
+def _row_factory(record):
+    """Returns a cursor row_factory that builds `record` namedtuples."""
+    return lambda cursor, row: record(*row)
+
+async def _fetch(db, record, sql, parameters=()):
+    """Executes a query and returns a cursor whose rows are `record` namedtuples."""
+    cursor = await db.execute(sql, parameters)
+    cursor.row_factory = _row_factory(record)
+    return cursor
+
+async def _sample_quote(scope=None, exclude_author_id=None):
+    index = await _quote_index.get()
+    # A sampled id can disappear if a delete lands between sampling and fetching; retry a few times.
+    for _ in range(3):
+        quote_id = index.sample(scope, exclude_author_id)
+        if quote_id is None:
+            return None
+        async with _reader() as db:
+            cursor = await _fetch(db, Quote, f"SELECT {_QUOTE_SELECT} FROM quotes WHERE id = ?", (quote_id,))
+            quote = await cursor.fetchone()
+        if quote is not None:
+            return quote
+    return None
+
+async def migrate():
+    """
+    Brings the schema up to date. Runs each migration newer than the database's PRAGMA user_version,
+    each in its own transaction, so a current database costs a single PRAGMA read.
+    """
+    global _fts_enabled
+    async with _writer() as db:
+        cursor = await db.execute("PRAGMA user_version")
+        (version,) = await cursor.fetchone()
+        if version > len(MIGRATIONS):
+            raise RuntimeError(f"The database is at schema version {version}, newer than this bot ({len(MIGRATIONS)})")
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            await db.execute("BEGIN")
+            await migration(db)
+            await db.execute(f"PRAGMA user_version = {number}")
+            await db.commit()
+            log.info("Applied schema migration %d (%s)", number, migration.__name__)
+
+        _fts_enabled = await _table_exists(db, "quotes_fts")
+        if not _fts_enabled:
+            # FTS5 is optional; retry in case SQLite has gained it since the migration ran.
+            await db.execute("BEGIN")
+            await _create_fts_index(db)
+
+async def _table_exists(db, name):
+    cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (name,))
+    return await cursor.fetchone() is not None
+
+# Migrations are append-only: never edit one that has shipped, add a new one instead. The early ones
+# are idempotent because databases from before versioning (user_version 0) may already have any of them.
+
+async def _create_quotes_table(db):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS quotes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER UNIQUE,
+            guild_id INTEGER,
+            channel_id INTEGER,
+            author_id INTEGER,
+            author_name TEXT,
+            content TEXT,
+            jump_url TEXT,
+            adder_user_id INTEGER,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+async def _add_attachment_columns(db):
+    # attachment_content_type is NULL for quotes added before attachments were stored,
+    # and '' once a quote is known to have no image.
+    await _add_column_if_missing(db, "quotes", "attachment_url", "TEXT")
+    await _add_column_if_missing(db, "quotes", "attachment_content_type", "TEXT")
+
+async def _create_guild_indexes(db):
+    # Every lookup is partitioned by guild; these also serve channel- and author-scoped queries.
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_quotes_guild_channel ON quotes (guild_id, channel_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_quotes_guild_author ON quotes (guild_id, author_id)")
+
+async def _create_backfill_checkpoints(db):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            channel_id INTEGER PRIMARY KEY,
+            last_message_id INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+async def _create_rotation_state(db):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS rotation_state (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            seed INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            high_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, channel_id)
+        ) WITHOUT ROWID
+    """)
+    # Ids of deleted quotes, so a reloaded QuoteIndex.ordered_ids keeps them and saved deals still line up.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS deleted_quotes (
+            guild_id INTEGER NOT NULL,
+            quote_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, quote_id)
+        ) WITHOUT ROWID
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS deleted_quotes_insert AFTER DELETE ON quotes WHEN old.guild_id IS NOT NULL BEGIN
+            INSERT OR IGNORE INTO deleted_quotes (guild_id, quote_id) VALUES (old.guild_id, old.id);
+        END
+    """)
+
+async def _create_quote_stats(db):
+    # How often each quote has been shown, used to pre-render popular quotes at startup.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS quote_stats (
+            message_id INTEGER PRIMARY KEY,
+            display_count INTEGER NOT NULL DEFAULT 0,
+            last_displayed_at TIMESTAMP
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_quote_stats_display_count ON quote_stats (display_count)")
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS quote_stats_delete AFTER DELETE ON quotes BEGIN
+            DELETE FROM quote_stats WHERE message_id = old.message_id;
+        END
+    """)
+
+async def _create_meta_table(db):
+    # Small key/value store for bookkeeping such as the last synced command tree hash.
+    await db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+async def _add_column_if_missing(db, table, column, definition):
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in await cursor.fetchall()}:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
-async def create_tables():
-    async with aiosqlite.connect(DATABASE_FILE) as db:
+async def _create_fts_index(db):
+    """Creates the FTS5 search index and its sync triggers, backfilling it for existing databases."""
+    global _fts_enabled
+    already_exists = await _table_exists(db, "quotes_fts")
+    try:
         await db.execute("""
-            CREATE TABLE IF NOT EXISTS quotes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message_id INTEGER UNIQUE,
-                guild_id INTEGER,
-                channel_id INTEGER,
-                author_id INTEGER,
-                author_name TEXT,
-                content TEXT,
-                jump_url TEXT,
-                adder_user_id INTEGER,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            CREATE VIRTUAL TABLE IF NOT EXISTS quotes_fts USING fts5(
+                content, author_name,
+                content='quotes', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
             )
         """)
-        await db.commit()
+    except sqlite3.OperationalError as e:
+        # SQLite was built without FTS5; /search falls back to LIKE.
+        log.warning("Full-text search unavailable, falling back to LIKE: %s", e)
+        _fts_enabled = False
+        return
+    # Individual statements rather than executescript(), which would commit the migration's transaction early.
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS quotes_fts_insert AFTER INSERT ON quotes BEGIN
+            INSERT INTO quotes_fts (rowid, content, author_name) VALUES (new.id, new.content, new.author_name);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS quotes_fts_delete AFTER DELETE ON quotes BEGIN
+            INSERT INTO quotes_fts (quotes_fts, rowid, content, author_name)
+            VALUES ('delete', old.id, old.content, old.author_name);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS quotes_fts_update AFTER UPDATE OF content, author_name ON quotes BEGIN
+            INSERT INTO quotes_fts (quotes_fts, rowid, content, author_name)
+            VALUES ('delete', old.id, old.content, old.author_name);
+            INSERT INTO quotes_fts (rowid, content, author_name) VALUES (new.id, new.content, new.author_name);
+        END
+    """)
+    if not already_exists:
+        # Databases created before the index existed need their rows indexed once.
+        await db.execute("INSERT INTO quotes_fts (quotes_fts) VALUES ('rebuild')")
+    _fts_enabled = True
 
-async def add_quote(message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id):
-    async with aiosqlite.connect(DATABASE_FILE) as db:
+async def _create_authors_table(db):
+    """
+    Creates the authors directory: one row per (guild, author) with the author's latest name and
+    quote count, kept in sync with quotes by triggers. Backfilled once for existing databases.
+    """
+    already_exists = await _table_exists(db, "authors")
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS authors (
+            guild_id INTEGER NOT NULL,
+            author_id INTEGER NOT NULL,
+            author_name TEXT COLLATE NOCASE,
+            quote_count INTEGER NOT NULL,
+            last_quote_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, author_id)
+        ) WITHOUT ROWID
+    """)
+    # Serves both name-ordered listing and case-insensitive prefix lookups.
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_authors_guild_name ON authors (guild_id, author_name, author_id)")
+    # Quotes saved before guild scoping have no guild and are left out, like everywhere else.
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS authors_insert AFTER INSERT ON quotes WHEN new.guild_id IS NOT NULL BEGIN
+            INSERT INTO authors (guild_id, author_id, author_name, quote_count, last_quote_id)
+            VALUES (new.guild_id, new.author_id, new.author_name, 1, new.id)
+            ON CONFLICT (guild_id, author_id) DO UPDATE SET
+                quote_count = quote_count + 1,
+                author_name = CASE WHEN excluded.last_quote_id > last_quote_id THEN excluded.author_name ELSE author_name END,
+                last_quote_id = MAX(last_quote_id, excluded.last_quote_id);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS authors_delete AFTER DELETE ON quotes WHEN old.guild_id IS NOT NULL BEGIN
+            DELETE FROM authors WHERE guild_id = old.guild_id AND author_id = old.author_id AND quote_count <= 1;
+            UPDATE authors SET quote_count = quote_count - 1
+            WHERE guild_id = old.guild_id AND author_id = old.author_id;
+            -- If the latest quote went, fall back to the name on the newest remaining one.
+            UPDATE authors SET (author_name, last_quote_id) = (
+                SELECT author_name, id FROM quotes
+                WHERE guild_id = old.guild_id AND author_id = old.author_id
+                ORDER BY id DESC LIMIT 1
+            )
+            WHERE guild_id = old.guild_id AND author_id = old.author_id AND last_quote_id = old.id;
+        END
+    """)
+    if not already_exists:
         await db.execute("""
-            INSERT INTO quotes (message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id))
-        await db.commit()
+            INSERT INTO authors (guild_id, author_id, author_name, quote_count, last_quote_id)
+            SELECT guild_id, author_id, author_name, COUNT(*), MAX(id) FROM quotes
+            WHERE guild_id IS NOT NULL
+            GROUP BY guild_id, author_id
+        """)
+
+# Schema version N is reached by applying the first N of these, in order.
+MIGRATIONS = [
+    _create_quotes_table,
+    _add_attachment_columns,
+    _create_guild_indexes,
+    _create_backfill_checkpoints,
+    _create_fts_index,
+    _create_authors_table,
+    _create_rotation_state,
+    _create_quote_stats,
+    _create_meta_table,
+]
+
+def _words(text):
+    """Returns the distinct lowercased words in text, split the way _fts_query splits search terms."""
+    return set(re.findall(r"\w+", (text or "").lower()))
+
+def _fts_query(term):
+    """Turns free text into an FTS5 query: every word must match, as a prefix."""
+    words = re.findall(r"\w+", term)
+    return " ".join(f'"{word}"*' for word in words)
+
+@timed_query
+async def add_quote(message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id,
+                    attachment_url=None, attachment_content_type=""):
+    """
+    Adds a quote in a single statement. Returns the new row once it has committed,
+    or None if the message was already quoted.
+    """
+    async def insert(db):
+        cursor = await _fetch(db, Quote, f"""
+            INSERT INTO quotes (message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id,
+                                attachment_url, attachment_content_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (message_id) DO NOTHING
+            RETURNING {_QUOTE_SELECT}
+        """, (message_id, guild_id, channel_id, author_id, author_name, content, jump_url, adder_user_id,
+              attachment_url, attachment_content_type))
+        return await cursor.fetchone()
+
+    def index(quote):
+        if quote is not None:
+            _index_added(quote.id, message_id, guild_id, channel_id, author_id, author_name, content)
+
+    return await _queued_write(insert, index)
+
+@timed_query
+async def add_quotes_bulk(rows, checkpoint=None):
+    """
+    Inserts many quotes in one transaction, skipping messages that are already quoted.
+
+    Args:
+        rows: Tuples in add_quote's argument order, attachment columns included.
+        checkpoint: An optional (channel_id, last_message_id) saved in the same transaction,
+            so a backfill resumes exactly where its last committed batch ended.
+
+    Returns:
+        The number of quotes inserted.
+    """
+    index = await _quote_index.get()
+
+    async def insert(db):
+        inserted = []
+        # Skip known quotes up front; ON CONFLICT catches any added earlier in the same batch.
+        new_rows = [row for row in rows if not index.has_message(row[0])]
+        if new_rows:
+            cursor = await db.execute("SELECT COALESCE(MAX(id), 0) FROM quotes")
+            (last_id,) = await cursor.fetchone()
+            await db.executemany("""
+                INSERT INTO quotes (message_id, guild_id, channel_id, author_id, author_name, content, jump_url,
+                                    adder_user_id, attachment_url, attachment_content_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (message_id) DO NOTHING
+            """, new_rows)
+            # AUTOINCREMENT ids only grow, so everything above last_id was inserted just now.
+            cursor = await db.execute(
+                "SELECT id, message_id, guild_id, channel_id, author_id, author_name, content FROM quotes WHERE id > ?",
+                (last_id,)
+            )
+            inserted = await cursor.fetchall()
+        if checkpoint is not None:
+            await db.execute("""
+                INSERT INTO backfill_checkpoints (channel_id, last_message_id) VALUES (?, ?)
+                ON CONFLICT (channel_id) DO UPDATE SET last_message_id = excluded.last_message_id,
+                                                       updated_at = CURRENT_TIMESTAMP
+            """, checkpoint)
+        return inserted
+
+    def index_inserted(inserted):
+        for row in inserted:
+            _index_added(*row)
+
+    return len(await _queued_write(insert, index_inserted))
+
+@timed_query
+async def get_meta(key, default=None):
+    async with _reader() as db:
+        cursor = await db.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+    return default if row is None else row[0]
+
+@timed_query
+async def set_meta(key, value):
+    async def upsert(db):
+        await db.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
 
+    await _queued_write(upsert)
+
+@timed_query
+async def get_backfill_checkpoint(channel_id):
+    """Returns the ID of the last message a backfill of this channel committed, or None."""
+    async with _reader() as db:
+        cursor = await db.execute("SELECT last_message_id FROM backfill_checkpoints WHERE channel_id = ?", (channel_id,))
+        result = await cursor.fetchone()
+        return result[0] if result else None
+
+@timed_query
+async def quote_exists(message_id):
+    """Checks the in-memory index for a quote of this message, without a database round trip."""
+    index = await _quote_index.get()
+    return index.has_message(message_id)
+
+@timed_query
+async def update_quote_attachment(message_id, attachment_url, attachment_content_type):
+    """Stores a (re)fetched image attachment for a quote; pass '' as the content type when it has none."""
+    async def update(db):
+        await db.execute(
+            "UPDATE quotes SET attachment_url = ?, attachment_content_type = ? WHERE message_id = ?",
+            (attachment_url, attachment_content_type, message_id)
+        )
+
+    await _queued_write(update)
+
+@timed_query
 async def get_quote_by_message_id(message_id):
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        cursor = await db.execute("SELECT * FROM quotes WHERE message_id = ?", (message_id,))
+    """Returns the Quote for a message, or None if it isn't quoted."""
+    async with _reader() as db:
+        cursor = await _fetch(db, Quote, f"SELECT {_QUOTE_SELECT} FROM quotes WHERE message_id = ?", (message_id,))
         return await cursor.fetchone()
 
-async def get_random_quote(channel_id=None):
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        cursor = await db.execute("SELECT * FROM quotes ORDER BY RANDOM() LIMIT 1")
+@timed_query
+async def get_quote_owner(message_id):
+    """Returns the QuoteOwner (guild, author and adder) of a message's quote, or None if it isn't quoted."""
+    async with _reader() as db:
+        cursor = await _fetch(
+            db, QuoteOwner, "SELECT guild_id, author_id, adder_user_id FROM quotes WHERE message_id = ?", (message_id,)
+        )
         return await cursor.fetchone()
 
-async def get_quotes_by_search_term(term):
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        cursor = await db.execute("SELECT * FROM quotes WHERE content LIKE ?", (f"%{term}%",))
+async def record_quote_display(message_id):
+    """Counts a display of the quote. Queued without waiting for the commit."""
+    async def record(db):
+        await db.execute("""
+            INSERT INTO quote_stats (message_id, display_count, last_displayed_at) VALUES (?, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (message_id) DO UPDATE SET display_count = display_count + 1,
+                                                   last_displayed_at = excluded.last_displayed_at
+        """, (message_id,))
+
+    await _queued_write_nowait(record)
+
+@timed_query
+async def get_popular_quotes(limit=100):
+    """Returns up to `limit` Quotes, most displayed first."""
+    columns = ", ".join(f"quotes.{column}" for column in QUOTE_COLUMNS)
+    async with _reader() as db:
+        cursor = await _fetch(db, Quote, f"""
+            SELECT {columns} FROM quote_stats
+            JOIN quotes ON quotes.message_id = quote_stats.message_id
+            ORDER BY quote_stats.display_count DESC
+            LIMIT ?
+        """, (limit,))
+        return await cursor.fetchall()
+
+@timed_query
+async def get_random_quote(guild_id=None):
+    """Returns a random Quote from the guild, or from every guild when guild_id is None."""
+    return await _sample_quote(None if guild_id is None else ("guild", guild_id))
+
+@timed_query
+async def deal_rotation_quote(guild_id, channel_id):
+    """
+    Returns the channel's next Quote from a shuffled deal of the guild's quotes, or None if the guild has none.
+
+    Every quote comes up once per channel before the deck is reshuffled; quotes added mid-deal join
+    the next one. The deal runs over positions in the guild's own id-ordered quote list, so it never
+    looks at other guilds' quotes. It is stored in rotation_state as (seed, position, size, high_id),
+    so it survives restarts without storing the order itself. Deleted quotes keep their place in the
+    list through deleted_quotes, so only a database changed behind the bot's back (e.g. a restored
+    backup) no longer lines up with a saved deal, which is then reshuffled.
+    """
+    index = await _quote_index.get()
+    scope = ("guild", guild_id)
+    key = (guild_id, channel_id)
+    if key not in _rotations:
+        async with _reader() as db:
+            cursor = await db.execute(
+                "SELECT seed, position, size, high_id FROM rotation_state WHERE guild_id = ? AND channel_id = ?", key
+            )
+            row = await cursor.fetchone()
+        if row is not None:
+            rotation = Rotation(*row)
+            if rotation.matches(index.ordered_ids(guild_id)):
+                _rotations.setdefault(key, rotation)
+
+    # Dealing is synchronous, so concurrent calls for the same channel never get the same position.
+    # Positions only land on the guild's own quotes; the walk skips only the deleted ones.
+    is_member = functools.partial(index.contains, scope)
+    for _ in range(3):  # A dealt quote can be deleted before it is fetched; deal again.
+        ids = index.ordered_ids(guild_id)
+        rotation = _rotations.get(key)
+        quote_id = rotation.deal(ids, is_member) if rotation is not None else None
+        if quote_id is None:
+            if not index.count(scope):
+                return None
+            rotation = _rotations[key] = Rotation.shuffle(ids)
+            quote_id = rotation.deal(ids, is_member)
+        await _save_rotation(key, rotation)
+        async with _reader() as db:
+            cursor = await _fetch(db, Quote, f"SELECT {_QUOTE_SELECT} FROM quotes WHERE id = ?", (quote_id,))
+            quote = await cursor.fetchone()
+        if quote is not None:
+            return quote
+    return None
+
+async def _save_rotation(key, rotation):
+    # Saved behind the caller's back: the in-memory deal is authoritative while the bot runs.
+    state = (*key, rotation.seed, rotation.position, rotation.size, rotation.high_id)
+
+    async def save(db):
+        await db.execute("""
+            INSERT INTO rotation_state (guild_id, channel_id, seed, position, size, high_id) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (guild_id, channel_id) DO UPDATE SET
+                seed = excluded.seed, position = excluded.position, size = excluded.size, high_id = excluded.high_id
+        """, state)
+
+    await _queued_write_nowait(save)
+
+@timed_query
+async def get_quotes_by_search_term(term, guild_id=None, after=None, limit=25):
+    """
+    Returns one page of QuoteLabels matching the term, best matches first.
+
+    Pass the (rank, id) of the last row as `after` to get the next page.
+    """
+    match = _fts_query(term)
+    async with _reader() as db:
+        if _fts_enabled and match:
+            guild_filter, guild_params = _guild_clause(guild_id, "AND", "quotes.guild_id")
+            page_filter, page_params = _keyset_clause(after, ("rank", "id"), "WHERE")
+            cursor = await _fetch(db, QuoteLabel, f"""
+                SELECT id, message_id, label, rank FROM (
+                    SELECT quotes.id, quotes.message_id, substr(quotes.content, 1, ?) AS label,
+                           bm25(quotes_fts, ?, ?) AS rank
+                    FROM quotes_fts
+                    JOIN quotes ON quotes.id = quotes_fts.rowid
+                    WHERE quotes_fts MATCH ? {guild_filter}
+                ) {page_filter}
+                ORDER BY rank, id
+                LIMIT ?
+            """, (LABEL_LENGTH, *FTS_COLUMN_WEIGHTS, match, *guild_params, *page_params, limit))
+        else:
+            # Without FTS every match ranks the same, so pages simply follow the id order.
+            guild_filter, guild_params = _guild_clause(guild_id, "AND")
+            page_filter, page_params = _keyset_clause(after and after[1:], ("id",))
+            cursor = await _fetch(db, QuoteLabel, f"""
+                SELECT id, message_id, substr(content, 1, ?), 0.0 FROM quotes
+                WHERE content LIKE ? {guild_filter} {page_filter}
+                ORDER BY id
+                LIMIT ?
+            """, (LABEL_LENGTH, f"%{term}%", *guild_params, *page_params, limit))
         return await cursor.fetchall()
 
+# Fuzzy quote search tries up to this many close vocabulary words for each word of the term.
+FUZZY_WORD_ALTERNATIVES = 3
+FUZZY_WORD_THRESHOLD = 70
+
+@timed_query
+async def fuzzy_search_quotes(term, guild_id, limit=25, threshold=70, candidate_limit=2000):
+    """
+    Returns up to `limit` QuoteLabels for the guild's quotes whose content fuzzily matches the term,
+    best first. Fuzzy matches have no rank.
+
+    Each word of the term is matched against the vocabulary of every quote (see _build_fuzzy_words),
+    and the full-text index shortlists quotes containing a close match for every word. Only that
+    shortlist is read and scored, so quote text is never held in memory.
+
+    Returns no matches until the word index has loaded (see load_indexes), rather than keep a
+    command waiting, or when full-text search is unavailable.
+    """
+    words = await _fuzzy_words.get(wait=False)
+    if words is None or not _fts_enabled:
+        return []
+    alternatives = await asyncio.gather(*(
+        words.search(word, scorer=fuzz.ratio, threshold=FUZZY_WORD_THRESHOLD, limit=FUZZY_WORD_ALTERNATIVES)
+        for word in _words(term)
+    ))
+    groups = [" OR ".join(f'"{word}"' for word, _ in matches) for matches in alternatives if matches]
+    if not groups:
+        return []
+    async with _reader() as db:
+        cursor = await db.execute("""
+            SELECT quotes.id, quotes.message_id, quotes.content
+            FROM quotes_fts
+            JOIN quotes ON quotes.id = quotes_fts.rowid
+            WHERE quotes_fts MATCH ? AND quotes.guild_id = ?
+            ORDER BY bm25(quotes_fts, ?, ?)
+            LIMIT ?
+        """, ("content : (" + " AND ".join(f"({group})" for group in groups) + ")", guild_id, *FTS_COLUMN_WEIGHTS,
+              candidate_limit))
+        pairs = [(QuoteLabel(quote_id, message_id, (content or "")[:LABEL_LENGTH]), (content or "").lower())
+                 for quote_id, message_id, content in await cursor.fetchall()]
+    matches = await score_candidates(term, pairs, scorer=fuzz.partial_ratio, threshold=threshold, limit=limit)
+    return [label for label, _ in matches]
+
+@timed_query
+async def fuzzy_search_authors(name, guild_id, limit=25, threshold=60):
+    """
+    Returns up to `limit` of the guild's Authors whose name fuzzily matches, best first, or none
+    until the index has loaded.
+    """
+    authors = await _fuzzy_authors.get(wait=False)
+    if authors is None or guild_id not in authors:
+        return []
+    matches = await authors[guild_id].search(name, scorer=fuzz.WRatio, threshold=threshold, limit=limit)
+    if not matches:
+        return []
+    ids = [author_id for author_id, _ in matches]
+    async with _reader() as db:
+        cursor = await _fetch(db, Author, f"""
+            SELECT author_id, author_name, quote_count FROM authors
+            WHERE guild_id = ? AND author_id IN ({', '.join('?' * len(ids))})
+        """, (guild_id, *ids))
+        rows = {row.author_id: row for row in await cursor.fetchall()}
+    return [rows[author_id] for author_id in ids if author_id in rows]
+
+@timed_query
+async def find_authors(text, guild_id, limit=25):
+    """
+    Returns up to `limit` of the guild's Authors for a partly typed name: case-insensitive prefix matches in name order, topped up with fuzzy matches.
+    """
+    prefix = re.sub(r"([\\%_])", r"\\\1", text)
+    async with _reader() as db:
+        # LIKE on the NOCASE author_name column is answered from idx_authors_guild_name.
+        cursor = await _fetch(db, Author, """
+            SELECT author_id, author_name, quote_count FROM authors
+            WHERE guild_id = ? AND author_name LIKE ? ESCAPE '\\'
+            ORDER BY author_name, author_id
+            LIMIT ?
+        """, (guild_id, f"{prefix}%", limit))
+        authors = await cursor.fetchall()
+    if text and len(authors) < limit:
+        seen = {author.author_id for author in authors}
+        fuzzy_authors = await fuzzy_search_authors(text, guild_id, limit=limit)
+        authors += [author for author in fuzzy_authors if author.author_id not in seen][:limit - len(authors)]
+    return authors
+
+@timed_query
+async def get_author(author_id, guild_id):
+    """Returns the guild's Author entry for the author, or None."""
+    async with _reader() as db:
+        cursor = await _fetch(
+            db, Author,
+            "SELECT author_id, author_name, quote_count FROM authors WHERE guild_id = ? AND author_id = ?",
+            (guild_id, author_id)
+        )
+        return await cursor.fetchone()
+
+@timed_query
 async def get_quotes_by_author(author_name):
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        cursor = await db.execute("SELECT * FROM quotes WHERE author_name LIKE ?", (f"%{author_name}%",))
+    async with _reader() as db:
+        cursor = await _fetch(
+            db, Quote, f"SELECT {_QUOTE_SELECT} FROM quotes WHERE author_name LIKE ?", (f"%{author_name}%",)
+        )
         return await cursor.fetchall()
 
+@timed_query
 async def delete_quote(message_id):
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        await db.execute("DELETE FROM quotes WHERE message_id = ?", (message_id,))
-        await db.commit()
+    async def delete(db):
+        cursor = await db.execute(
+            "DELETE FROM quotes WHERE message_id = ? RETURNING id, guild_id, author_id", (message_id,)
+        )
+        return await cursor.fetchall()
 
+    def unindex(deleted):
+        for quote_id, guild_id, author_id in deleted:
+            _index_removed(quote_id, guild_id, author_id)
+
+    await _queued_write(delete, unindex)
+
+@timed_query
 async def get_last_author(channel_id):  # Still here but unused by /randomquote
-    async with aiosqlite.connect(DATABASE_FILE) as db:
+    async with _reader() as db:
         cursor = await db.execute("SELECT author_id FROM quotes WHERE channel_id = ? ORDER BY id DESC LIMIT 1", (channel_id,))
         result = await cursor.fetchone()
         return result[0] if result else None
 
-async def get_random_quote_not_by_author(author_id, channel_id):
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        cursor = await db.execute(
-            "SELECT * FROM quotes WHERE author_id != ? AND channel_id = ? ORDER BY RANDOM() LIMIT 1",
-            (author_id, channel_id)
-        )
-        quote = await cursor.fetchone()
-        if quote is None:
-            cursor = await db.execute(
-                "SELECT * FROM quotes WHERE author_id != ? ORDER BY RANDOM() LIMIT 1",
-                (author_id,)
-            )
-            quote = await cursor.fetchone()
-        return quote
+@timed_query
+async def get_random_quote_not_by_author(author_id, channel_id, guild_id=None):
+    """Prefers the channel's quotes, then falls back to the rest of the guild (or every guild if guild_id is None)."""
+    quote = await _sample_quote(("channel", channel_id), exclude_author_id=author_id)
+    if quote is None:
+        quote = await _sample_quote(None if guild_id is None else ("guild", guild_id), exclude_author_id=author_id)
+    return quote
+
+@timed_query
+async def get_all_unique_authors(guild_id=None, after=None, limit=None):
+    """
+    Returns Authors from the authors directory ordered by name, using each author's latest name.
 
-async def get_all_unique_authors():
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        cursor = await db.execute("SELECT DISTINCT author_id, author_name FROM quotes ORDER BY author_name")
+    With a limit, returns one page; pass the (author_name, author_id) of the last row as `after`
+    to get the next one.
+    """
+    guild_filter, guild_params = _guild_clause(guild_id)
+    page_filter, page_params = _keyset_clause(after, ("author_name", "author_id"), "AND" if guild_filter else "WHERE")
+    async with _reader() as db:
+        cursor = await _fetch(db, Author, f"""
+            SELECT author_id, author_name, quote_count FROM authors {guild_filter} {page_filter}
+            ORDER BY author_name, author_id
+            LIMIT ?
+        """, (*guild_params, *page_params, -1 if limit is None else limit))
         return await cursor.fetchall()
 
-async def get_quotes_by_author_id(author_id):
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        cursor = await db.execute("SELECT * FROM quotes WHERE author_id = ?", (author_id,))
+@timed_query
+async def get_quotes_by_author_id(author_id, guild_id=None, after=None, limit=25):
+    """
+    Returns one page of QuoteLabels for the author's quotes, oldest first.
+
+    Pass the id of the last row as `after` to get the next page.
+    """
+    guild_filter, guild_params = _guild_clause(guild_id, "AND")
+    page_filter, page_params = _keyset_clause(None if after is None else (after,), ("id",))
+    async with _reader() as db:
+        # Walks the (guild_id, author_id) index in id order, so a page costs `limit` rows however prolific the author.
+        cursor = await _fetch(db, QuoteLabel, f"""
+            SELECT id, message_id, substr(content, 1, ?) FROM quotes
+            WHERE author_id = ? {guild_filter} {page_filter}
+            ORDER BY id
+            LIMIT ?
+        """, (LABEL_LENGTH, author_id, *guild_params, *page_params, limit))
         return await cursor.fetchall()
 
-async def get_quote_count():
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        cursor = await db.execute("SELECT COUNT(*) FROM quotes")
+@timed_query
+async def get_quote_count(guild_id=None):
+    guild_filter, guild_params = _guild_clause(guild_id)
+    async with _reader() as db:
+        cursor = await db.execute(f"SELECT COUNT(*) FROM quotes {guild_filter}", guild_params)
         count = await cursor.fetchone()
         return count[0]
 
-async def get_available_quotes_count(author_id, channel_id):
-    async with aiosqlite.connect(DATABASE_FILE) as db:
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM quotes WHERE author_id != ? AND channel_id = ?",
-            (author_id, channel_id)
-        )
-        count = await cursor.fetchone()
-        return count[0]
+async def iter_quotes(guild_id=None, chunk_size=1000):
+    """
+    Yields every quote in the guild (or in every guild when guild_id is None) as lists of up to
+    `chunk_size` ExportedQuotes, in id order.
+
+    Each chunk is its own short read, so a long export never holds a reader connection or a
+    snapshot while the consumer writes chunks out. Quotes added or deleted mid-export may or may
+    not be included; use backup() for a consistent copy.
+    """
+    # "+guild_id" keeps SQLite from using the guild indexes, which would sort the whole guild per
+    # chunk; walking the rowid from the last id keeps every chunk proportional to its size.
+    guild_filter, guild_params = _guild_clause(guild_id, "WHERE", "+guild_id")
+    after = None
+    while True:
+        page_filter, page_params = _keyset_clause(after, ("id",), "AND" if guild_filter else "WHERE")
+        async with _reader() as db:
+            cursor = await _fetch(db, ExportedQuote, f"""
+                SELECT {", ".join(EXPORT_COLUMNS)} FROM quotes
+                {guild_filter} {page_filter}
+                ORDER BY id
+                LIMIT ?
+            """, (*guild_params, *page_params, chunk_size))
+            chunk = await cursor.fetchall()
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        after = (chunk[-1].id,)
+
+# Online backups copy this many pages (4 KiB each by default) per step, pausing BACKUP_STEP_DELAY
+# seconds between steps so a multi-GB copy doesn't saturate the disk the bot is using.
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_DELAY = 0.01
+
+async def backup(target_path, source_path=None, pages_per_step=BACKUP_PAGES_PER_STEP, step_delay=BACKUP_STEP_DELAY):
+    """
+    Copies a consistent snapshot of the database to target_path while the bot keeps running.
+
+    Uses SQLite's online backup API from a dedicated connection in a worker thread, so the shared
+    connections and the event loop are never held up. The copy is written next to target_path and
+    renamed into place once complete. source_path defaults to the connected database.
+
+    Returns the size of the backup in bytes.
+    """
+    if source_path is None:
+        source_path = _manager.path if _manager is not None else DATABASE_FILE
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _copy_database, source_path, target_path, pages_per_step, step_delay)
+    return os.path.getsize(target_path)
+
+def _copy_database(source_path, target_path, pages_per_step, step_delay):
+    partial_path = target_path + ".partial"
+    # Read-only, so a wrong path fails instead of creating (and backing up) an empty database.
+    source_uri = f"file:{pathname2url(os.path.abspath(source_path))}?mode=ro"
+    source = sqlite3.connect(source_uri, uri=True, isolation_level=None)
+    target = sqlite3.connect(partial_path)
+    try:
+        # Pin one read snapshot for the whole copy; without it every write committed between
+        # steps would restart the backup from the first page.
+        _begin_snapshot(source)
+        source.backup(target, pages=pages_per_step, progress=lambda status, remaining, total: time.sleep(step_delay))
+        source.execute("COMMIT")
+    except BaseException:
+        target.close()
+        with contextlib.suppress(OSError):
+            os.remove(partial_path)
+        raise
+    finally:
+        target.close()
+        source.close()
+    os.replace(partial_path, target_path)
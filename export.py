@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# export.py
+"""
+Exports quotes to JSON Lines or CSV, and takes online backups of the quote database.
+
+Both are safe while the bot is running. Exports stream quotes in chunks (see
+database.iter_quotes), with file writes done off the event loop. Backups copy a consistent
+snapshot through SQLite's online backup API (see database.backup). Neither holds up quote adds or
+/randomquote responses.
+
+Used by the /export and /backup commands in bot.py, or from the command line (e.g. from a nightly
+cron job):
+
+    python export.py backup [PATH]
+    python export.py jsonl [PATH] [--guild GUILD_ID]
+    python export.py csv [PATH] [--guild GUILD_ID]
+
+Without a PATH, files are written to BACKUP_DIR with a timestamped name.
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+import discord
+
+from config import BACKUP_DIR, LOG_LEVEL
+import database
+
+log = logging.getLogger(__name__)
+
+FORMATS = ("jsonl", "csv")
+CHUNK_SIZE = 1000  # Quotes read per query and written per file write.
+
+def default_path(kind, extension, guild_id=None):
+    """Returns a timestamped path in BACKUP_DIR, e.g. backups/quotes-export-20261018-020000.jsonl."""
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    scope = "" if guild_id is None else f"-{guild_id}"
+    return os.path.join(BACKUP_DIR, f"quotes-{kind}{scope}-{timestamp}.{extension}")
+
+def _chunk_writer(file, fmt):
+    """Returns a function that writes one chunk of ExportedQuotes to the open file."""
+    if fmt == "jsonl":
+        def write_chunk(chunk):
+            file.write("".join(json.dumps(quote._asdict(), ensure_ascii=False) + "\n" for quote in chunk))
+        return write_chunk
+    if fmt == "csv":
+        writer = csv.writer(file)
+        writer.writerow(database.EXPORT_COLUMNS)
+        return writer.writerows
+    raise ValueError(f"Unknown export format: {fmt}")
+
+async def export_quotes(path, fmt, guild_id=None, chunk_size=CHUNK_SIZE):
+    """
+    Streams the guild's quotes (or every guild's, when guild_id is None) to a file.
+
+    Args:
+        path: The file to write. It is written under a temporary name and renamed into place once complete.
+        fmt: "jsonl" (one JSON object per line) or "csv" (with a header row).
+        guild_id: Restricts the export to one guild.
+        chunk_size: The number of quotes read and written at a time.
+
+    Returns:
+        The number of quotes exported.
+    """
+    loop = asyncio.get_running_loop()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial_path = path + ".partial"
+    count = 0
+    try:
+        with open(partial_path, "w", encoding="utf-8", newline="") as file:
+            write_chunk = _chunk_writer(file, fmt)
+            async for chunk in database.iter_quotes(guild_id, chunk_size):
+                await loop.run_in_executor(None, write_chunk, chunk)
+                count += len(chunk)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, path)
+    log.info("Exported %d quote(s) to %s", count, path)
+    return count
+
+async def backup_database(path=None):
+    """Writes an online backup to path (default: a timestamped file in BACKUP_DIR); returns (path, size in bytes)."""
+    path = path or default_path("backup", "db")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    size = await database.backup(path)
+    log.info("Backed up the quote database to %s (%d bytes)", path, size)
+    return path, size
+
+async def run(args):
+    if args.command == "backup":
+        await backup_database(args.path)
+        return
+    await database.connect()
+    try:
+        await database.migrate()
+        await export_quotes(args.path or default_path("export", args.command, args.guild), args.command, args.guild)
+    finally:
+        await database.close()
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=("backup",) + FORMATS)
+    parser.add_argument("path", nargs="?", help="Output file (default: a timestamped file in BACKUP_DIR).")
+    parser.add_argument("--guild", type=int, help="Export only this guild's quotes.")
+    args = parser.parse_args(argv)
+    if args.command == "backup" and args.guild is not None:
+        parser.error("--guild only applies to exports; backups always copy the whole database")
+
+    discord.utils.setup_logging(level=logging.getLevelName(LOG_LEVEL), root=True)
+    asyncio.run(run(args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
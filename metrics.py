@@ -0,0 +1,126 @@
+# metrics.py
+"""
+Lightweight in-process metrics, rendered in the Prometheus text format.
+
+Counters and histograms are plain dictionaries updated inline, so recording costs a dict lookup
+and an addition. The optional HTTP endpoint (METRICS_PORT in config.py) serves them at /metrics.
+"""
+import asyncio
+import bisect
+import functools
+import logging
+import time
+from collections import defaultdict
+
+log = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow REST calls.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REGISTRY = []
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = defaultdict(float)
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        self._values[tuple(sorted(labels.items()))] += amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {value:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-1]:g}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+COMMAND_LATENCY = Histogram("quotebot_command_seconds", "Slash command handler latency.")
+DB_QUERY_LATENCY = Histogram("quotebot_db_query_seconds", "database.py function latency.")
+DISCORD_API_CALLS = Counter("quotebot_discord_api_calls_total", "Discord REST calls made by the bot.")
+WRITE_BATCHES = Histogram("quotebot_write_batch_size", "Write operations committed per group-commit transaction.",
+                          buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+CACHE_REQUESTS = Counter("quotebot_cache_requests_total", "In-process cache lookups by cache and result (hit/miss).")
+
+def timed(histogram, label):
+    """Decorates a coroutine function to record its latency in `histogram`, labelled with its name."""
+    def decorator(func):
+        labels = {label: func.__name__}
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+async def _handle_request(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass  # Skip headers.
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def start_http_server(host, port):
+    """Serves /metrics on host:port; returns the asyncio server so it can be closed on shutdown."""
+    server = await asyncio.start_server(_handle_request, host, port)
+    log.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,265 @@
+# sampling.py
+import bisect
+import random
+from array import array
+from collections import defaultdict
+
+# How many random draws to try before switching to the exact per-author walk.
+MAX_REJECTION_DRAWS = 16
+
+# Rounds of the Feistel network in FeistelPermutation; four give a well-mixed shuffle.
+FEISTEL_ROUNDS = 4
+_MASK_64 = (1 << 64) - 1
+
+class IdBag:
+    """A set of ids with O(1) add, remove and uniform random choice."""
+
+    __slots__ = ("_items", "_positions")
+
+    def __init__(self):
+        self._items = []
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item_id):
+        return item_id in self._positions
+
+    def add(self, item_id):
+        if item_id in self._positions:
+            return
+        self._positions[item_id] = len(self._items)
+        self._items.append(item_id)
+
+    def discard(self, item_id):
+        position = self._positions.pop(item_id, None)
+        if position is None:
+            return
+        # Move the last id into the freed slot so the list stays dense.
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def choice(self):
+        return random.choice(self._items) if self._items else None
+
+class FeistelPermutation:
+    """
+    A pseudo-random permutation of range(size), determined by a seed.
+
+    Each position is computed on demand by a small Feistel network over the next even power of
+    two, cycle-walking values that land outside the range back into it. Nothing proportional to
+    `size` is stored, so a shuffled deal is fully described by (seed, size, position).
+    """
+
+    __slots__ = ("size", "_half_bits", "_half_mask", "_keys")
+
+    def __init__(self, size, seed):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self._half_bits = (bits + 1) // 2
+        self._half_mask = (1 << self._half_bits) - 1
+        keys = random.Random(seed)
+        self._keys = [keys.getrandbits(64) for _ in range(FEISTEL_ROUNDS)]
+
+    def __len__(self):
+        return self.size
+
+    def _round(self, value, key):
+        # The splitmix64 finalizer: every output bit depends on every input bit.
+        mixed = (value + key) & _MASK_64
+        mixed = ((mixed ^ (mixed >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+        mixed = ((mixed ^ (mixed >> 27)) * 0x94D049BB133111EB) & _MASK_64
+        return (mixed ^ (mixed >> 31)) & self._half_mask
+
+    def _encrypt(self, value):
+        left, right = value >> self._half_bits, value & self._half_mask
+        for key in self._keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self._half_bits) | right
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        # The network permutes [0, 4**half_bits), at most 4x the range, so this loop is short.
+        value = self._encrypt(position)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+class Rotation:
+    """
+    One shuffled deal of the first `size` ids of a guild's id-ordered list (see
+    QuoteIndex.ordered_ids), each coming up once.
+
+    Quotes added after the shuffle sit past `size` and join the next deal; deleted ones are skipped
+    as they come up. (seed, position, size, high_id) is the whole state, so it is cheap to persist;
+    high_id, the last dealt id, tells whether a reloaded list still lines up with the deal.
+    """
+
+    __slots__ = ("seed", "position", "size", "high_id", "_permutation")
+
+    def __init__(self, seed, position, size, high_id):
+        self.seed = seed
+        self.position = position
+        self.size = size
+        self.high_id = high_id
+        self._permutation = FeistelPermutation(size, seed)
+
+    @classmethod
+    def shuffle(cls, ids):
+        """Starts a deal of every id currently in `ids`, which must not be empty."""
+        return cls(random.getrandbits(63), 0, len(ids), ids[-1])
+
+    def matches(self, ids):
+        """True if the first `size` entries of `ids` are still the ones this deal was shuffled from."""
+        return bisect.bisect_right(ids, self.high_id) == self.size
+
+    def deal(self, ids, is_member):
+        """Returns the next id for which is_member(id) is true, or None once the deal is exhausted."""
+        while self.position < self.size:
+            item_id = ids[self._permutation[self.position]]
+            self.position += 1
+            if is_member(item_id):
+                return item_id
+        return None
+
+class QuoteIndex:
+    """
+    In-memory index of quote ids, bucketed by scope: ("guild", guild_id) or ("channel", channel_id).
+
+    Sampling never touches the database; callers fetch the chosen row by primary key. Per-author
+    buckets are only built for a scope the first time sample() needs its exact author walk.
+    """
+
+    def __init__(self):
+        self._quotes = {}  # quote id -> (guild id, channel id, author id, message id)
+        self._message_ids = {}  # message id -> quote id
+        self._scopes = defaultdict(IdBag)
+        self._author_bags = {}  # scope -> {author id -> IdBag of quote ids}, for scopes sample() walked by author
+        # guild id -> every quote id added to the guild, in id order. Deleted ids stay (and are
+        # reloaded from deleted_quotes), so the positions a Rotation deals from never shift under it.
+        self._ordered_ids = defaultdict(lambda: array("q"))
+
+    def __len__(self):
+        return len(self._quotes)
+
+    @staticmethod
+    def scopes_for(guild_id, channel_id):
+        return (("guild", guild_id), ("channel", channel_id))
+
+    def has_message(self, message_id):
+        return message_id in self._message_ids
+
+    def count(self, scope):
+        bag = self._scopes.get(scope)
+        return len(bag) if bag is not None else 0
+
+    def contains(self, scope, quote_id):
+        bag = self._scopes.get(scope)
+        return bag is not None and quote_id in bag
+
+    def ordered_ids(self, guild_id):
+        """Returns the guild's quote ids in id order, including deleted ones."""
+        return self._ordered_ids.get(guild_id) or array("q")
+
+    def add(self, quote_id, message_id, guild_id, channel_id, author_id):
+        if quote_id in self._quotes:
+            return
+        self._quotes[quote_id] = (guild_id, channel_id, author_id, message_id)
+        self._message_ids[message_id] = quote_id
+        for scope in self.scopes_for(guild_id, channel_id):
+            self._scopes[scope].add(quote_id)
+            authors = self._author_bags.get(scope)
+            if authors is not None:
+                authors[author_id].add(quote_id)
+        self.add_deleted(quote_id, guild_id)
+
+    def add_deleted(self, quote_id, guild_id):
+        """Places a quote id in the guild's ordered_ids without indexing the quote, e.g. one deleted before loading."""
+        ids = self._ordered_ids[guild_id]
+        if not ids or quote_id > ids[-1]:
+            ids.append(quote_id)  # ids only grow, so this is the usual case
+        else:
+            position = bisect.bisect_left(ids, quote_id)
+            if position == len(ids) or ids[position] != quote_id:
+                ids.insert(position, quote_id)
+
+    def remove(self, quote_id):
+        entry = self._quotes.pop(quote_id, None)
+        if entry is None:
+            return
+        guild_id, channel_id, author_id, message_id = entry
+        self._message_ids.pop(message_id, None)
+        for scope in self.scopes_for(guild_id, channel_id):
+            self._scopes[scope].discard(quote_id)
+            authors = self._author_bags.get(scope)
+            if authors is not None:
+                author_bag = authors[author_id]
+                author_bag.discard(quote_id)
+                if not author_bag:
+                    del authors[author_id]
+
+    def _authors(self, scope):
+        """Returns the scope's quotes bucketed by author, building the buckets on first use."""
+        authors = self._author_bags.get(scope)
+        if authors is None:
+            authors = self._author_bags[scope] = defaultdict(IdBag)
+            for quote_id in self._scopes[scope]._items:
+                authors[self._quotes[quote_id][2]].add(quote_id)
+        return authors
+
+    def sample(self, scope=None, exclude_author_id=None):
+        """
+        Returns a random quote id from the scope, optionally skipping one author, or None.
+
+        A scope of None samples every guild: a guild is picked in proportion to its quote count,
+        then a quote within it.
+        """
+        if scope is None:
+            return self._sample_any(exclude_author_id)
+        bag = self._scopes.get(scope)
+        if not bag:
+            return None
+        if exclude_author_id is None:
+            return bag.choice()
+
+        # Cheap path: while the excluded author is a minority a few draws almost always succeed.
+        for _ in range(MAX_REJECTION_DRAWS):
+            quote_id = bag.choice()
+            if self._quotes[quote_id][2] != exclude_author_id:
+                return quote_id
+
+        # The excluded author dominates this scope; pick one of the other authors
+        # weighted by their quote counts, then a quote within that author's bucket.
+        authors = self._authors(scope)
+        excluded = authors.get(exclude_author_id)
+        remaining = len(bag) - (len(excluded) if excluded else 0)
+        if remaining <= 0:
+            return None
+        target = random.randrange(remaining)
+        for author_id, author_bag in authors.items():
+            if author_id == exclude_author_id:
+                continue
+            if target < len(author_bag):
+                return author_bag.choice()
+            target -= len(author_bag)
+        return None
+
+    def _sample_any(self, exclude_author_id=None):
+        guilds = [(scope, bag) for scope, bag in self._scopes.items() if scope[0] == "guild" and bag]
+        while guilds:
+            target = random.randrange(sum(len(bag) for _, bag in guilds))
+            for position, (scope, bag) in enumerate(guilds):
+                if target < len(bag):
+                    break
+                target -= len(bag)
+            quote_id = self.sample(scope, exclude_author_id)
+            if quote_id is not None:
+                return quote_id
+            del guilds[position]  # Only the excluded author's quotes here.
+        return None
@@ -0,0 +1,207 @@
+# scheduler.py
+"""
+Posts the recurring quotes listed in RECURRING_QUOTES_FILE.
+
+A single task keeps every upcoming post in a heap ordered by due time and sleeps until the
+earliest one. Each post's quote is picked and its embed built PREPARE_AHEAD seconds early, so
+the message goes out on time even if the database or CDN is slow. The file is re-read whenever
+its modification time changes, so posts can be added or edited without restarting the bot.
+
+Schedule file format ("day" is 0 for Monday to 6 for Sunday, or omit it to post daily). Times are
+UTC unless they carry an offset such as "12:00+02:00", which is converted to UTC (moving "day" too
+if the conversion crosses midnight):
+
+    [
+        {"name": "weekly_monday_quote", "day": 0, "time": "12:00", "channel_id": 123, "message": "Happy Monday"}
+    ]
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta, timezone
+
+log = logging.getLogger(__name__)
+
+PREPARE_AHEAD = 30  # Seconds before a post is due to pick its quote and build the embed.
+RELOAD_INTERVAL = 60  # Check the schedule file for changes at least this often (seconds).
+MISSED_GRACE = 300  # Still send a post this many seconds late (e.g. after a stall); skip it beyond that.
+
+RecurringPost = namedtuple("RecurringPost", "name day time channel_id message")
+
+_A_MONDAY = date(2024, 1, 1)  # Reference week for converting (day, time) pairs.
+
+def _to_utc(day, local_time):
+    """Converts a (day, time) pair whose time may carry a UTC offset to the equivalent UTC (day, time)."""
+    if local_time.tzinfo is None:
+        return day, local_time.replace(tzinfo=timezone.utc)
+    local = datetime.combine(_A_MONDAY + timedelta(days=day or 0), local_time)
+    utc = local.astimezone(timezone.utc)
+    if day is not None:
+        day = (utc.date() - _A_MONDAY).days % 7
+    return day, utc.timetz()
+
+def parse_post(entry):
+    """Builds a RecurringPost from one schedule file entry. Raises ValueError if it is malformed."""
+    try:
+        day = entry.get("day")
+        if day is not None and not 0 <= int(day) <= 6:
+            raise ValueError(f"day must be 0-6, got {day}")
+        day, utc_time = _to_utc(None if day is None else int(day), time.fromisoformat(entry["time"]))
+        return RecurringPost(
+            name=str(entry["name"]),
+            day=day,
+            time=utc_time,
+            channel_id=int(entry["channel_id"]),
+            message=entry.get("message") or "",
+        )
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"invalid entry {entry!r}: {e}") from None
+
+def next_occurrence(post, after):
+    """Returns the first datetime strictly after `after` (an aware datetime) at which the post is due."""
+    after = after.astimezone(timezone.utc)
+    due = datetime.combine(after.date(), post.time)
+    if post.day is not None:
+        due += timedelta(days=(post.day - after.weekday()) % 7)
+    while due <= after:
+        due += timedelta(days=1 if post.day is None else 7)
+    return due
+
+class RecurringQuoteScheduler:
+    """
+    Runs the recurring posts from one schedule file.
+
+    `build_post(channel, post)` returns the (content, embed) to send, or None to skip this occurrence.
+    start() is idempotent, so calling it again on reconnects never duplicates posts.
+    """
+
+    def __init__(self, bot, path, build_post, prepare_ahead=PREPARE_AHEAD):
+        self.bot = bot
+        self.path = path
+        self.build_post = build_post
+        self.prepare_ahead = prepare_ahead
+        self.posts = []
+        self._mtime = None
+        self._heap = []  # (due timestamp, tie-breaker, post)
+        self._prepared = {}  # (post, due timestamp) -> (content, embed) or None
+        self._counter = itertools.count()
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name="recurring-quotes")
+            self._task.add_done_callback(self._stopped)
+
+    def _stopped(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Recurring quotes stopped; no more posts until a restart", exc_info=task.exception())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def reload_if_changed(self):
+        """Re-reads the schedule file if it changed since the last load. Returns True if it was reloaded."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        posts = []
+        if mtime is not None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    entries = json.load(f)
+                if not isinstance(entries, list):
+                    raise ValueError(f"expected a list of posts, got {type(entries).__name__}")
+            except (OSError, ValueError) as e:
+                # Keep the current schedule until the file is fixed.
+                log.error("Could not read %s, keeping the previous schedule: %s", self.path, e)
+                return False
+            for entry in entries:
+                try:
+                    posts.append(parse_post(entry))
+                except ValueError as e:
+                    log.error("Skipping recurring quote in %s: %s", self.path, e)
+        self.posts = posts
+        self._reschedule()
+        log.info("Loaded %d recurring quote(s) from %s", len(posts), self.path)
+        return True
+
+    def _reschedule(self):
+        now = datetime.now(timezone.utc)
+        self._heap = [(next_occurrence(post, now).timestamp(), next(self._counter), post) for post in self.posts]
+        heapq.heapify(self._heap)
+        # Keep payloads that were already prepared for posts that are still scheduled.
+        scheduled = {(post, due) for due, _, post in self._heap}
+        self._prepared = {key: payload for key, payload in self._prepared.items() if key in scheduled}
+
+    async def _prepare(self, post):
+        channel = self.bot.get_channel(post.channel_id)
+        if channel is None:
+            # Not visible to this process (e.g. on another shard's guild) or deleted.
+            log.debug("Recurring quote %s: channel %s not found", post.name, post.channel_id)
+            return None
+        try:
+            return await self.build_post(channel, post)
+        except Exception:
+            log.exception("Failed to prepare recurring quote %s", post.name)
+            return None
+
+    async def _send(self, post, payload):
+        channel = self.bot.get_channel(post.channel_id)
+        if channel is None or payload is None:
+            return
+        content, embed = payload
+        try:
+            await channel.send(content, embed=embed)
+            log.info("Posted recurring quote %s in channel %s", post.name, post.channel_id)
+        except Exception:
+            log.exception("Failed to post recurring quote %s", post.name)
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                self.reload_if_changed()
+            except Exception:
+                log.exception("Reloading %s failed, keeping the previous schedule", self.path)
+            if not self._heap:
+                await asyncio.sleep(RELOAD_INTERVAL)
+                continue
+
+            now = datetime.now(timezone.utc).timestamp()
+            # Prepare every post due within the window, so posts due together all go out on time.
+            for due, _, post in sorted(self._heap):
+                if due - now > self.prepare_ahead:
+                    break
+                if (post, due) not in self._prepared:
+                    self._prepared[(post, due)] = await self._prepare(post)
+
+            due, _, post = self._heap[0]
+            now = datetime.now(timezone.utc).timestamp()
+            if due > now:
+                wake_in = due - now if due - now <= self.prepare_ahead else due - now - self.prepare_ahead
+                await asyncio.sleep(min(wake_in, RELOAD_INTERVAL))
+                continue
+
+            heapq.heappop(self._heap)
+            payload = self._prepared.pop((post, due), None)
+            if now - due > MISSED_GRACE:
+                log.warning("Skipping recurring quote %s, %.0f seconds late", post.name, now - due)
+            else:
+                await self._send(post, payload)
+            next_due = next_occurrence(post, datetime.fromtimestamp(max(due, now), timezone.utc)).timestamp()
+            heapq.heappush(self._heap, (next_due, next(self._counter), post))
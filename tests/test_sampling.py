@@ -0,0 +1,118 @@
+import asyncio
+import random
+import sqlite3
+
+import database
+from sampling import QuoteIndex, Rotation
+
+def sparse_index(big_guild_quotes=5000, small_guild_quotes=(3, 17)):
+    """A big guild whose quotes surround a few small guilds' quotes, spread thinly across the id space."""
+    index = QuoteIndex()
+    small = {guild_id: [] for guild_id in range(2, 2 + len(small_guild_quotes))}
+    quota = dict(zip(small, small_guild_quotes))
+    rng = random.Random(7)
+    positions = {guild_id: sorted(rng.sample(range(big_guild_quotes), quota[guild_id])) for guild_id in small}
+    quote_id = 0
+    for i in range(big_guild_quotes):
+        for guild_id, at in positions.items():
+            if i in at:
+                quote_id += 1
+                index.add(quote_id, quote_id, guild_id, guild_id * 10, 1)
+                small[guild_id].append(quote_id)
+        quote_id += 1
+        index.add(quote_id, quote_id, 1, 10, 1)
+    return index, small
+
+def deal_all(index, guild_id, rotation):
+    ids = index.ordered_ids(guild_id)
+    checks = []
+
+    def is_member(quote_id):
+        checks.append(quote_id)
+        return index.contains(("guild", guild_id), quote_id)
+
+    dealt = []
+    while (quote_id := rotation.deal(ids, is_member)) is not None:
+        dealt.append(quote_id)
+    return dealt, checks
+
+def test_deal_yields_each_quote_of_a_sparse_guild_once():
+    index, small = sparse_index()
+    for guild_id, quote_ids in small.items():
+        dealt, checks = deal_all(index, guild_id, Rotation.shuffle(index.ordered_ids(guild_id)))
+        assert sorted(dealt) == quote_ids
+        # The deal only visits the guild's own quotes, never the big guild's.
+        assert len(checks) == len(quote_ids)
+
+def test_deal_skips_deleted_and_defers_added_quotes():
+    index, small = sparse_index()
+    quote_ids = small[3]
+    rotation = Rotation.shuffle(index.ordered_ids(3))
+    first = rotation.deal(index.ordered_ids(3), lambda quote_id: index.contains(("guild", 3), quote_id))
+    deleted = next(quote_id for quote_id in quote_ids if quote_id != first)
+    index.remove(deleted)
+    index.add(10 ** 6, 10 ** 6, 3, 30, 1)
+
+    dealt, _ = deal_all(index, 3, rotation)
+    assert sorted([first] + dealt) == sorted(set(quote_ids) - {deleted})
+    assert rotation.matches(index.ordered_ids(3))
+
+def test_rotation_state_survives_a_restart(tmp_path):
+    path = str(tmp_path / "quotes.db")
+
+    async def deal(count):
+        await database.connect(path)
+        try:
+            return [(await database.deal_rotation_quote(2, 20)).id for _ in range(count)]
+        finally:
+            await database.close()
+
+    async def run():
+        await database.connect(path)
+        try:
+            await database.migrate()
+        finally:
+            await database.close()
+        # Interleave a two-quote guild with a much bigger one.
+        db = sqlite3.connect(path)
+        with db:
+            for i in range(2000):
+                guild_id = 2 if i in (500, 1500) else 1
+                db.execute(
+                    "INSERT INTO quotes (message_id, guild_id, channel_id, author_id, author_name, content, jump_url,"
+                    " adder_user_id) VALUES (?, ?, ?, 1, 'a', 'text', 'u', 1)", (i, guild_id, guild_id * 10)
+                )
+        db.close()
+        first = await deal(1)
+        # Let the queued rotation_state write land, then deal the rest after a restart.
+        rest = await deal(3)
+        return first + rest
+
+    dealt = asyncio.run(run())
+    expected = sorted(sqlite3.connect(path).execute("SELECT id FROM quotes WHERE guild_id = 2").fetchall())
+    assert sorted(dealt[:2]) == [quote_id for (quote_id,) in expected]
+    assert sorted(dealt[2:]) == [quote_id for (quote_id,) in expected]
+
+def test_rotation_survives_a_delete_and_restart(tmp_path):
+    path = str(tmp_path / "quotes.db")
+
+    async def run():
+        await database.connect(path)
+        try:
+            await database.migrate()
+            for i in range(10):
+                await database.add_quote(i, 1, 10, 1, "a", "text", "u", 1)
+            first = [(await database.deal_rotation_quote(1, 10)).id for _ in range(3)]
+            undealt = next(quote_id for quote_id in range(1, 11) if quote_id not in first)
+            await database.delete_quote(undealt - 1)  # message ids start at 0
+        finally:
+            await database.close()
+        await database.connect(path)
+        try:
+            rest = [(await database.deal_rotation_quote(1, 10)).id for _ in range(6)]
+        finally:
+            await database.close()
+        return first, undealt, rest
+
+    first, undealt, rest = asyncio.run(run())
+    assert sorted(first + rest) == sorted(set(range(1, 11)) - {undealt})
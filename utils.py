@@ -1,7 +1,20 @@
 # utils.py
+import asyncio
+import functools
+import heapq
+import time
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
 from fuzzywuzzy import fuzz
 
-def fuzzy_search(query, items, key=None, scorer=fuzz.ratio, threshold=60):
+from config import FUZZY_EXECUTOR, FUZZY_OFFLOAD_THRESHOLD, REACTION_EMOJI
+import metrics
+
+NGRAM_SIZE = 3
+
+def fuzzy_search(query, items, key=None, scorer=fuzz.ratio, threshold=60, limit=None):
     """
     Performs a fuzzy search on a list of items.
 
@@ -11,14 +24,217 @@ def fuzzy_search(query, items, key=None, scorer=fuzz.ratio, threshold=60):
         key: An optional function to extract the string to compare against from each item.
         scorer: The fuzzywuzzy scorer function to use (default: fuzz.ratio).
         threshold: The minimum score to consider a match (0-100).
+        limit: An optional maximum number of results to return.
 
     Returns:
         A list of tuples, where each tuple contains a matching item and its score.
     """
+    pairs = [(item, (key(item) if key else item).lower()) for item in items]
+    return score_batch(query.lower(), pairs, scorer, threshold, limit)
+
+def score_batch(query, pairs, scorer=fuzz.ratio, threshold=60, limit=None):
+    """
+    Scores pre-lowercased (item, text) pairs against a lowercased query.
+
+    Kept at module level so it can be shipped to a process pool.
+
+    Returns:
+        A list of (item, score) tuples, best first.
+    """
     results = []
-    for item in items:
-        value = key(item) if key else item
-        score = scorer(query.lower(), value.lower())
+    for item, text in pairs:
+        score = scorer(query, text)
         if score >= threshold:
             results.append((item, score))
-    return sorted(results, key=lambda x: x[1], reverse=True) # Sort by score (descending)
+    if limit is not None:
+        return heapq.nlargest(limit, results, key=lambda x: x[1])
+    return sorted(results, key=lambda x: x[1], reverse=True)  # Sort by score (descending)
+
+def ngrams(text, n=NGRAM_SIZE):
+    """Returns the set of character n-grams in text, padded so short strings still produce some."""
+    padded = f"{' ' * (n - 1)}{text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+class FuzzyIndex:
+    """
+    An n-gram index used to narrow fuzzy search down to a shortlist of candidates before scoring.
+
+    Keys are reference counted, so the same key (e.g. an author id) can be added once per quote
+    and only leaves the index when the last of them is removed. Text is stored lowercased.
+    """
+
+    def __init__(self, n=NGRAM_SIZE):
+        self.n = n
+        self._texts = {}
+        self._refs = Counter()
+        self._postings = defaultdict(set)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, key, text, count=1):
+        """Adds `count` references to the key, re-indexing it if its text changed."""
+        text = (text or "").lower()
+        self._refs[key] += count
+        old_text = self._texts.get(key)
+        if old_text == text:
+            return
+        if old_text is not None:
+            self._unindex(key, old_text)
+        self._texts[key] = text
+        for gram in ngrams(text, self.n):
+            self._postings[gram].add(key)
+
+    def remove(self, key):
+        if key not in self._texts:
+            return
+        self._refs[key] -= 1
+        if self._refs[key] > 0:
+            return
+        del self._refs[key]
+        self._unindex(key, self._texts.pop(key))
+
+    def _unindex(self, key, text):
+        for gram in ngrams(text, self.n):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[gram]
+
+    def candidates(self, query, limit=2000):
+        """
+        Returns up to `limit` (key, text) pairs sharing the most n-grams with the query.
+
+        Only reads the index, so it can run in a worker thread while the event loop keeps adding and
+        removing keys: each posting set is counted in a single C call, and keys removed meanwhile are dropped.
+        """
+        postings = (self._postings.get(g) for g in ngrams(query.lower(), self.n))
+        grams = [posting for posting in postings if posting]
+        if not grams:
+            return []
+        # Count rare grams first; once the shortlist is large, skip grams that would match most of the index.
+        grams.sort(key=len)
+        common = max(limit, len(self._texts) // 5)
+        shared = Counter()
+        for posting in grams:
+            if shared and len(posting) > common:
+                break
+            shared.update(posting)
+        best = heapq.nlargest(limit, shared.items(), key=lambda x: x[1])
+        texts = ((key, self._texts.get(key)) for key, _ in best)
+        return [(key, text) for key, text in texts if text is not None]
+
+    def search_now(self, query, scorer=fuzz.ratio, threshold=60, limit=25, candidate_limit=2000):
+        """Picks the shortlist and scores it in the calling thread; returns (key, score) tuples, best first."""
+        pairs = self.candidates(query, candidate_limit)
+        return score_batch(query.lower(), pairs, scorer, threshold, limit) if pairs else []
+
+    async def search(self, query, scorer=fuzz.ratio, threshold=60, limit=25, candidate_limit=2000):
+        """
+        Fuzzy-matches the query against indexed texts. Picking the shortlist and scoring it run
+        together in the thread pool, so the event loop never does either for a large index.
+        """
+        executor = get_executor()
+        if executor is None or len(self) < FUZZY_OFFLOAD_THRESHOLD:
+            return self.search_now(query, scorer, threshold, limit, candidate_limit)
+        loop = asyncio.get_running_loop()
+        if isinstance(executor, ProcessPoolExecutor):
+            # The index stays in this process: pick the shortlist in a thread, then ship only that.
+            pairs = await loop.run_in_executor(None, self.candidates, query, candidate_limit)
+            return await score_candidates(query, pairs, scorer, threshold, limit)
+        job = functools.partial(self.search_now, query, scorer, threshold, limit, candidate_limit)
+        return await loop.run_in_executor(executor, job)
+
+async def score_candidates(query, pairs, scorer=fuzz.ratio, threshold=60, limit=None):
+    """Scores (item, text) pairs like score_batch, in the pool from get_executor() when there are many of them."""
+    if not pairs:
+        return []
+    job = functools.partial(score_batch, query.lower(), pairs, scorer, threshold, limit)
+    executor = get_executor()
+    if executor is None or len(pairs) < FUZZY_OFFLOAD_THRESHOLD:
+        return job()
+    return await asyncio.get_running_loop().run_in_executor(executor, job)
+
+_executor = None
+
+def get_executor():
+    """Returns the shared pool used for large fuzzy scoring jobs, per FUZZY_EXECUTOR, or None to score inline."""
+    global _executor
+    if _executor is None and FUZZY_EXECUTOR:
+        if FUZZY_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=2)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="fuzzy")
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+class TTLCache:
+    """A bounded LRU cache whose entries also expire after a time-to-live. Hits and misses are counted by name."""
+
+    def __init__(self, name, maxsize=1024, ttl=3600):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """True if the key has an entry, expired or not. Not counted as a hit or miss."""
+        return key in self._entries
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.time():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            metrics.CACHE_REQUESTS.inc(cache=self.name, result="miss")
+            return default
+        metrics.CACHE_REQUESTS.inc(cache=self.name, result="hit")
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value, expires_at=None):
+        """Stores a value until `expires_at` (a UNIX timestamp), capped at the cache's ttl."""
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        self._entries[key] = (deadline, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+def attachment_expiry(url):
+    """Returns the UNIX time a signed Discord CDN URL expires at (its `ex` parameter), or None if unsigned."""
+    query = parse_qs(urlsplit(url).query)
+    try:
+        return int(query["ex"][0], 16)
+    except (KeyError, IndexError, ValueError):
+        return None
+
+def first_image_attachment(message):
+    """Returns (url, content_type) of the message's first image attachment, or (None, '') if it has none."""
+    for attachment in message.attachments:
+        if attachment.content_type and attachment.content_type.startswith('image/'):
+            return attachment.url, attachment.content_type
+    return None, ""
+
+def is_quote_emoji(emoji):
+    """Checks an emoji (a PartialEmoji, Emoji or plain string) against the configured REACTION_EMOJI."""
+    if isinstance(REACTION_EMOJI, int):  # Custom Emoji
+        return getattr(emoji, "id", None) == REACTION_EMOJI
+    if isinstance(REACTION_EMOJI, str):  # Standard Emoji
+        return (emoji if isinstance(emoji, str) else getattr(emoji, "name", None)) == REACTION_EMOJI
+    return False